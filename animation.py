@@ -1,3 +1,5 @@
+from types import MappingProxyType
+
 import pygame
 
 from classes import StateMachine
@@ -7,16 +9,40 @@ from zs_constants import UDLR
 
 # from zs_cfg import print_dict
 
+# compiled animation definitions, keyed by (animation file, machine class,
+# scale). Each one holds the animation dicts, hitbox cfg and compiled hitbox
+# table that every machine made from that definition shares, so only the
+# state, frame counters and caches are kept per machine
+ANIMATION_DEFINITIONS = {}
+
+# scaled and mirrored sprite sheets, keyed by (file, scale) and then one
+# (file, position) for each image layer added to them, and the image sets
+# cut from each sheet for an animation definition
+SPRITE_SHEETS = {}
+IMAGE_SETS = {}
+
 
 class AnimationGraphics(Graphics):
     def __init__(self, entity, sprite_sheet, scale=1):
         super(AnimationGraphics, self).__init__(entity)
 
-        sprite_sheet = load_resource(sprite_sheet)
+        self.scale = scale
+
+        key = sprite_sheet, scale
+        if key not in SPRITE_SHEETS:
+            SPRITE_SHEETS[key] = self.load_sprite_sheet(sprite_sheet, scale)
+
+        self.sheet_key = key
+        self.sprite_sheet, self.mirror_sheet = SPRITE_SHEETS[key]
+
+        self.image_sets = {}
+
+    @staticmethod
+    def load_sprite_sheet(file_name, scale=1):
+        sprite_sheet = load_resource(file_name)
         w, h = sprite_sheet.get_size()
 
         # PYGAME CHOKE POINT
-        self.scale = scale
 
         if scale > 1:
             w *= scale
@@ -24,13 +50,12 @@ class AnimationGraphics(Graphics):
 
             sprite_sheet = pygame.transform.scale(sprite_sheet, (w, h))
 
-        self.sprite_sheet = sprite_sheet
-        self.mirror_sheet = self.mirror_image(sprite_sheet)
+        mirror_sheet = AnimationGraphics.mirror_image(sprite_sheet)
 
-        ImageGraphics.set_colorkey(self.sprite_sheet)
-        ImageGraphics.set_colorkey(self.mirror_sheet)
+        ImageGraphics.set_colorkey(sprite_sheet)
+        ImageGraphics.set_colorkey(mirror_sheet)
 
-        self.image_sets = {}
+        return sprite_sheet, mirror_sheet
 
     @staticmethod
     def mirror_image(image):
@@ -38,27 +63,37 @@ class AnimationGraphics(Graphics):
 
         return pygame.transform.flip(image, True, False)
 
+    # the layer is drawn on a copy of the sheet, since sheets are shared
     def add_image_layer(self, file_name, position=(0, 0)):
-        image_layer = load_resource(file_name)
-        ImageGraphics.set_colorkey(image_layer)
+        key = self.sheet_key + ((file_name, tuple(position)),)
 
-        # PYGAME CHOKE POINT
+        if key not in SPRITE_SHEETS:
+            image_layer = load_resource(file_name)
+            ImageGraphics.set_colorkey(image_layer)
 
-        scale = self.scale
-        w, h = image_layer.get_size()
+            # PYGAME CHOKE POINT
 
-        if scale > 1:
-            w *= scale
-            h *= scale
+            scale = self.scale
+            w, h = image_layer.get_size()
+
+            if scale > 1:
+                w *= scale
+                h *= scale
 
-            image_layer = pygame.transform.scale(image_layer, (w, h))
+                image_layer = pygame.transform.scale(image_layer, (w, h))
 
-        x, y = position
-        x *= scale
-        y *= scale
+            x, y = position
+            x *= scale
+            y *= scale
+
+            sprite_sheet = self.sprite_sheet.copy()
+            sprite_sheet.blit(image_layer, (x, y))
 
-        self.sprite_sheet.blit(image_layer, (x, y))
-        self.mirror_sheet = self.mirror_image(self.sprite_sheet)
+            SPRITE_SHEETS[key] = (
+                sprite_sheet, self.mirror_image(sprite_sheet))
+
+        self.sheet_key = key
+        self.sprite_sheet, self.mirror_sheet = SPRITE_SHEETS[key]
 
     def get_image(self):
         machine = self.entity.animation_machine
@@ -90,7 +125,23 @@ class AnimationGraphics(Graphics):
             rect.size = w, h
             rect.center = cx, cy
 
-    def set_animations(self, animations):
+    # image sets are shared between graphics with the same sheet when the
+    # animation definition's key is passed
+    def set_animations(self, animations, key=None):
+        if key is not None:
+            key = self.sheet_key, key
+
+            if key not in IMAGE_SETS:
+                IMAGE_SETS[key] = self.make_image_sets(animations)
+
+            self.image_sets = IMAGE_SETS[key]
+
+        else:
+            self.image_sets = self.make_image_sets(animations)
+
+    def make_image_sets(self, animations):
+        image_sets = {}
+
         for name in animations:
             if "mirror" in animations[name]:
                 sprite_sheet = self.mirror_sheet
@@ -98,10 +149,12 @@ class AnimationGraphics(Graphics):
             else:
                 sprite_sheet = self.sprite_sheet
 
-            self.image_sets[name] = self.make_image_set(
+            image_sets[name] = self.make_image_set(
                 sprite_sheet, animations[name], scale=self.scale
             )
 
+        return image_sets
+
     @staticmethod
     def make_image_set(sprite_sheet, animation, scale=1):
         mirror = animation.get("mirror", False)
@@ -147,8 +200,31 @@ class AnimationMachine(StateMachine):
         self.animations = {}
         self.hitboxes = {}
         self.hitbox_tables = {}
+        self.hitbox_table = None
+        self.definition_key = None
         self.last_state = None
 
+        # the current animation's name, dict and frame index, and whether
+        # its sound should play this frame. These are worked out by refresh
+        # on each update or state change so lookups during the frame are
+        # attribute reads
+        self.current_name = None
+        self.current_animation = None
+        self.current_frame = 0
+        self.sound_trigger = False
+
+        # while the sprite is out of view, refreshes are put off until the
+        # animation state or frame is looked up, or it comes back into view
+        self.in_view = True
+        self.stale = False
+
+        # hitbox lists for each key, with the (position, state, frame, scale)
+        # stamp they were made for
+        self.hitbox_cache = {}
+        self.hitbox_cache_hits = 0
+        self.hitbox_cache_misses = 0
+        self.hitbox_cache_stats = 0, 0
+
     def set_hitboxes(self, cfg):
         if "hitboxes" in cfg:
             self.hitboxes = cfg["hitboxes"]
@@ -156,54 +232,139 @@ class AnimationMachine(StateMachine):
         if "hitbox_tables" in cfg:
             self.hitbox_tables = cfg["hitbox_tables"]
 
+        self.hitbox_table = None
+        self.hitbox_cache = {}
+
+    # hitboxes are only remade when the sprite's position, animation state or
+    # animation frame have changed since the last call with the same key.
+    # The list returned is shared, so callers shouldn't change it. Hot paths
+    # should use get_hitbox_templates, which doesn't make any dicts
     def get_hitboxes(self, key=False):
+        stamp = (
+            self.entity.rect.topleft, self.get_animation_state(),
+            self.get_animation_frame(), self.entity.graphics.scale
+        )
+        cached = self.hitbox_cache.get(key)
+
+        if cached and cached[0] == stamp:
+            self.hitbox_cache_hits += 1
+
+            return cached[1]
+
+        self.hitbox_cache_misses += 1
+        templates, offset = self.get_hitbox_templates(key)
+        h_list = [self.place_hitbox(t, offset) for t in templates]
+        self.hitbox_cache[key] = stamp, h_list
+
+        return h_list
+
+    # returns the (hits, misses) of the hitbox cache over the last frame
+    def get_hitbox_cache_stats(self):
+        return self.hitbox_cache_stats
+
+    # returns the hitbox dict for a template at the sprite's position
+    @staticmethod
+    def place_hitbox(template, offset):
+        x, y = template["position"]
+        ox, oy = offset
+
+        return dict(template, position=(x + ox, y + oy))
+
+    # returns the current frame's compiled hitboxes for a key as a tuple of
+    # read only dicts shared by every machine made from the same animation
+    # file, and the (x, y) offset that their positions are relative to
+    def get_hitbox_templates(self, key=False):
+        if self.hitbox_table is None:
+            self.hitbox_table = self.compile_hitboxes()
+
         name = self.get_animation_state()
-        scale = self.entity.graphics.scale
-        px, py = self.entity.rect.topleft
+        table = self.hitbox_table
+
+        if name not in table:
+            table[name] = self.relabel_hitboxes(
+                table[self.get_default_state()], name)
+
+        return (table[name][self.get_animation_frame()].get(key, ()),
+                self.entity.rect.topleft)
+
+    # states without their own animation use the default state's hitboxes,
+    # with the animation tag set to the state's name
+    @staticmethod
+    def relabel_hitboxes(frames, name):
+        relabeled = []
 
-        table = self.hitbox_tables
+        for frame in frames:
+            templates = {}
+
+            for tag in frame:
+                templates[tag] = tuple(
+                    MappingProxyType(dict(t, animation=name))
+                    for t in frame[tag])
+
+            relabeled.append(templates)
+
+        return relabeled
+
+    # resolves the hitbox names for every frame of every animation into
+    # read only hitbox dicts that are already scaled, with their positions
+    # relative to the sprite's top left corner. Each frame maps False, for
+    # all of its hitboxes, and each tag (body, hurtbox, damage...) to a tuple
+    # of those dicts
+    def compile_hitboxes(self):
+        scale = self.entity.graphics.scale
         hitboxes = self.hitboxes
+        tables = self.hitbox_tables
+        compiled = {}
 
-        ani = self.get_animation()
+        for name in self.animations:
+            animation = self.animations[name]
+            frames = []
 
-        h_list = []
-        h_list += ani.get("hitboxes", [])
+            for i in range(len(animation["frames"])):
+                names = list(animation.get("hitboxes", []))
 
-        if name in table:
-            frame = table[name][
-                self.get_animation_frame()]
+                if name in tables:
+                    entry = tables[name].get(i)
 
-            if type(frame) is list:
-                h_list += frame
+                    if type(entry) is list:
+                        names += entry
 
-        h_list = [hitboxes[n].copy() for n in h_list]
+                frame = {False: []}
 
-        if key:
-            h_list = [hb for hb in h_list if key in hb]
+                for n in names:
+                    hb = hitboxes[n].copy()
+                    hb["animation"] = name
 
-        for hb in h_list:
-            hb["animation"] = name
+                    if "size" in hb:
+                        w, h = hb["size"]
+                        hb["size"] = w * scale, h * scale
 
-            if "size" in hb:
-                w, h = hb["size"]
-                w *= scale
-                h *= scale
-                hb["size"] = w, h
+                    if "radius" in hb:
+                        hb["radius"] *= scale
 
-            if "radius" in hb:
-                hb["radius"] *= scale
+                    x, y = hb["position"]
+                    hb["position"] = x * scale, y * scale
+                    hb = MappingProxyType(hb)
 
-            x, y = hb["position"]
-            x *= scale
-            x += px
-            y *= scale
-            y += py
-            hb["position"] = x, y
+                    for tag in hb:
+                        if tag not in ("size", "radius", "position",
+                                       "animation"):
+                            frame.setdefault(tag, []).append(hb)
 
-        return h_list
+                    frame[False].append(hb)
+
+                frames.append(
+                    {tag: tuple(frame[tag]) for tag in frame})
+
+            compiled[name] = frames
+
+        return compiled
 
     def get_animation(self, state=None):
         if not state:
+            if self.current_animation:
+                return self.current_animation
+
             state = self.get_animation_state()
 
         if state in self.animations:
@@ -217,46 +378,127 @@ class AnimationMachine(StateMachine):
         return "idle"
 
     def get_animation_state(self):
-        state = self.get_state()
+        if self.stale:
+            self.refresh()
 
-        return state
+        if self.current_name:
+            return self.current_name
 
-    def get_animation_frame(self):
-        d = self.get_animation()
+        return self.get_animation_name()
 
-        fl = d["frame_length"]
-        sf = self.get_state_frame()
+    # the name of the animation for the current state
+    def get_animation_name(self):
+        return self.get_state()
 
-        l = len(d["frames"])
+    def get_animation_frame(self):
+        if self.stale:
+            self.refresh()
 
-        return (sf // fl) % l
+        return self.current_frame
 
     def get_state_frame(self):
         return self.state_frame
 
+    # the current animation can be stale for the face direction while the
+    # sprite is out of view, but each direction's animation has the same
+    # length
     def animation_complete(self):
-        animation = self.get_animation()
-        l = len(animation["frames"]) * animation["frame_length"] - 1
+        return self.get_state_frame() >= self.get_animation()["length"] - 1
+
+    # works out the current animation and frame. Called on each update and
+    # state change, and by the entity when something its animation name
+    # depends on changes, like its face direction
+    def refresh(self):
+        name = self.get_animation_name()
+        animation = self.get_animation(name)
+        schedule = animation["schedule"]
+        state_frame = self.state_frame
+        frame = schedule[state_frame % len(schedule)]
+
+        self.current_name = name
+        self.current_animation = animation
+        self.current_frame = frame
+        self.stale = False
+
+        self.sound_trigger = (
+            animation.get("sound_frame", 0) == frame and
+            state_frame % len(animation["frames"]) == 0
+        )
+
+    # refreshes now when the sprite is in view, or on the next lookup
+    def request_refresh(self):
+        if self.in_view:
+            self.refresh()
+
+        else:
+            self.stale = True
 
-        return self.get_state_frame() >= l
+    def set_in_view(self, value):
+        self.in_view = value
+
+        if value and self.stale:
+            self.refresh()
 
     def set_state(self, state):
         self.last_state = self.get_state()
 
         super(AnimationMachine, self).set_state(state)
+        self.reset_animation()
+        self.refresh()
 
         if self.entity.graphics:
             self.entity.graphics.reset_image()
 
-        self.reset_animation()
+    # each animation gets a schedule of frame indexes, one for every
+    # state frame of a loop through the animation, so the frame for any
+    # state frame is schedule[state_frame % length]
+    @staticmethod
+    def compile_schedules(animations):
+        for animation in animations.values():
+            fl = animation["frame_length"]
+            schedule = tuple(
+                i for i in range(len(animation["frames"]))
+                for f in range(fl)
+            )
+
+            animation["schedule"] = schedule
+            animation["length"] = len(schedule)
 
     def set_animations(self, file_name):
+        key = file_name, type(self).__name__, self.entity.graphics.scale
+
+        if key not in ANIMATION_DEFINITIONS:
+            ANIMATION_DEFINITIONS[key] = self.load_animation_definition(
+                file_name)
+
+        definition = ANIMATION_DEFINITIONS[key]
+        self.definition_key = key
+        self.animations = definition["animations"]
+        self.hitboxes = definition["hitboxes"]
+        self.hitbox_tables = definition["hitbox_tables"]
+        self.hitbox_table = definition["hitbox_table"]
+        self.hitbox_cache = {}
+
+        if self.states:
+            self.refresh()
+
+    # the animation and hitbox dicts returned are shared by every machine
+    # using the definition, so they shouldn't be changed after this
+    def load_animation_definition(self, file_name):
         cfg = load_resource(file_name)
         self.animations = self.get_animations_from_cfg(cfg)
+        self.compile_schedules(self.animations)
 
         if "hitboxes" in cfg:
             self.set_hitboxes(cfg)
 
+        return {
+            "animations": self.animations,
+            "hitboxes": self.hitboxes,
+            "hitbox_tables": self.hitbox_tables,
+            "hitbox_table": self.compile_hitboxes()
+        }
+
     def get_animations_from_cfg(self, cfg):
         animations = {}
 
@@ -290,13 +532,19 @@ class AnimationMachine(StateMachine):
         super(AnimationMachine, self).update()
 
         self.state_frame += 1
+        self.request_refresh()
+
+        self.hitbox_cache_stats = (
+            self.hitbox_cache_hits, self.hitbox_cache_misses)
+        self.hitbox_cache_hits = 0
+        self.hitbox_cache_misses = 0
 
     def auto(self):
         return self.animation_complete()
 
 
 class UdlrAnimationMachine(AnimationMachine):
-    def get_animation_state(self):
+    def get_animation_name(self):
         return self.get_direction_state_string()
 
     def get_direction_state_string(self, state=None):
@@ -306,7 +554,7 @@ class UdlrAnimationMachine(AnimationMachine):
         return state + "_" + self.entity.get_dir_string()
 
     def get_animation(self, state=None):
-        if state in self.animations:
+        if not state or state in self.animations:
             return super(UdlrAnimationMachine, self).get_animation(state)
 
         else:
@@ -0,0 +1,100 @@
+from random import Random
+from timeit import timeit
+
+from collisions import CollisionManager
+from geometry import Rect, SpatialHash, SweepAndPrune
+
+# run from the project root:
+#   python -m benchmarks.broadphase
+
+SPRITE_COUNTS = 100, 1000, 5000
+SPRITE_SIZE = 24
+DENSITY = 1 / 10000         # sprites per square pixel
+FRAMES = 10
+
+
+class BenchSprite:
+    def __init__(self, name, position):
+        self.name = name
+        self.rect = Rect((SPRITE_SIZE, SPRITE_SIZE), position)
+
+        self.collision_category = 1
+        self.collision_mask = 1
+
+    def is_asleep(self):
+        return False
+
+    def get_collision_rect(self):
+        return self.rect
+
+
+def make_sprites(n, seed=0):
+    random = Random(seed)
+    side = (n / DENSITY) ** .5
+
+    return [BenchSprite("sprite {}".format(i),
+                        (random.uniform(0, side), random.uniform(0, side)))
+            for i in range(n)]
+
+
+def test(a, b):
+    return a.rect.get_rect_collision(b.rect)
+
+
+# each sprite moves a pixel or two every frame, like sprites in a game
+def move_sprites(sprites, frame):
+    for i, s in enumerate(sprites):
+        dx = 1 if (i + frame) % 4 < 2 else -1
+        s.rect.move((dx, dx * (i % 3 - 1)))
+
+
+def all_pairs_frame(sprites):
+    return CollisionManager.group_perm_collision_system(
+        sprites, test, None)
+
+
+def broadphase_frame(broadphase, sprites):
+    broadphase.set_items([(s, CollisionManager.get_collision_bounds(s))
+                          for s in sprites])
+
+    return CollisionManager.group_perm_collision_system(
+        sprites, test, None, broadphase.get_pairs())
+
+
+def time_frames(sprites, frames, do_frame):
+    def frame():
+        move_sprites(sprites, frame.count)
+        frame.count += 1
+        do_frame()
+    frame.count = 0
+
+    return timeit(frame, number=frames) * 1000 / frames
+
+
+def main():
+    print("{:>8} {:>12} {:>12} {:>12} {:>12} {:>12} {:>12}".format(
+        "sprites", "all pairs", "hash pairs", "sap pairs",
+        "all (ms)", "hash (ms)", "sap (ms)"))
+
+    for n in SPRITE_COUNTS:
+        sprites = make_sprites(n)
+        sh = SpatialHash()
+        sap = SweepAndPrune()
+
+        p1 = all_pairs_frame(sprites)
+        p2 = broadphase_frame(sh, sprites)
+        p3 = broadphase_frame(sap, sprites)
+
+        frames = FRAMES if n <= 1000 else 1
+        t1 = time_frames(sprites, frames, lambda: all_pairs_frame(sprites))
+        t2 = time_frames(
+            sprites, FRAMES, lambda: broadphase_frame(sh, sprites))
+        t3 = time_frames(
+            sprites, FRAMES, lambda: broadphase_frame(sap, sprites))
+
+        print("{:>8} {:>12} {:>12} {:>12} {:>12.2f} {:>12.2f} {:>12.2f}".format(
+            n, p1, p2, p3, t1, t2, t3))
+
+
+if __name__ == "__main__":
+    main()
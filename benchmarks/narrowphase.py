@@ -0,0 +1,75 @@
+from random import Random
+from timeit import timeit
+
+from collisions import CollisionManager
+from geometry import Rect
+from physics import PhysicsInterface
+
+# run from the project root:
+#   python -m benchmarks.narrowphase
+
+SPRITE_COUNTS = 50, 100, 200, 500
+SPRITE_SIZE = 24
+DENSITY = 1 / 2500          # sprites per square pixel
+FRAMES = 10
+
+
+class BenchSprite:
+    def __init__(self, name, position):
+        self.name = name
+        self.rect = Rect((SPRITE_SIZE, SPRITE_SIZE), position)
+
+        self.collision_category = 1
+        self.collision_mask = 1
+
+    def is_asleep(self):
+        return False
+
+    def get_collision_rect(self):
+        return self.rect
+
+
+def make_sprites(n, seed=0):
+    random = Random(seed)
+    side = (n / DENSITY) ** .5
+
+    return [BenchSprite("sprite {}".format(i),
+                        (random.uniform(0, side), random.uniform(0, side)))
+            for i in range(n)]
+
+
+def loop_frame(sprites, found):
+    def handle(item, other, collision):
+        found.append((item, other, collision))
+
+    CollisionManager.group_perm_collision_system(
+        sprites, PhysicsInterface.test_sprite_collision, handle)
+
+
+def vectorized_frame(sprites, found):
+    found += CollisionManager.get_overlapping_pairs(sprites)
+
+
+def main():
+    print("{:>8} {:>10} {:>14} {:>16} {:>8}".format(
+        "sprites", "overlaps", "loop (ms)", "vectorized (ms)", "speedup"))
+
+    for n in SPRITE_COUNTS:
+        sprites = make_sprites(n)
+
+        found_loop, found_vectorized = [], []
+        loop_frame(sprites, found_loop)
+        vectorized_frame(sprites, found_vectorized)
+        assert found_loop == found_vectorized
+
+        t1 = timeit(lambda: loop_frame(sprites, []), number=FRAMES)
+        t2 = timeit(lambda: vectorized_frame(sprites, []), number=FRAMES)
+
+        t1 *= 1000 / FRAMES
+        t2 *= 1000 / FRAMES
+        print("{:>8} {:>10} {:>14.2f} {:>16.2f} {:>7.1f}x".format(
+            n, len(found_loop), t1, t2, t1 / t2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+from timeit import timeit
+
+from geometry import Rect
+from physics import PhysicsInterface, PhysicsWorld
+
+# run from the project root:
+#   python -m benchmarks.physics_world
+
+BODY_COUNTS = 10, 100, 1000, 10000
+FRAMES = 100
+
+
+class BenchBody:
+    def __init__(self, name, i):
+        self.name = name
+        self.rect = Rect((10, 10), (i % 100, i // 100))
+
+        self.physics_interface = PhysicsInterface(self)
+        self.physics_interface.set_interface()
+        self.set_gravity(.1)
+
+    @property
+    def position(self):
+        return self.rect.position
+
+    def move(self, dxdy):
+        self.rect.move(dxdy)
+
+
+def make_bodies(n):
+    return [BenchBody("body {}".format(i), i) for i in range(n)]
+
+
+def interface_frame(bodies):
+    for b in bodies:
+        b.apply_force(1, 0)
+        b.physics_interface.update()
+
+
+def world_frame(world, bodies):
+    for b in bodies:
+        b.apply_force(1, 0)
+    world.step()
+
+
+def main():
+    print("{:>8} {:>16} {:>16} {:>8}".format(
+        "bodies", "interface (ms)", "world (ms)", "speedup"))
+
+    for n in BODY_COUNTS:
+        bodies = make_bodies(n)
+        t1 = timeit(lambda: interface_frame(bodies), number=FRAMES)
+
+        bodies = make_bodies(n)
+        world = PhysicsWorld("benchmark world")
+        world.set_bodies(bodies)
+        t2 = timeit(lambda: world_frame(world, bodies), number=FRAMES)
+
+        t1 *= 1000 / FRAMES
+        t2 *= 1000 / FRAMES
+        print("{:>8} {:>16.3f} {:>16.3f} {:>7.1f}x".format(
+            n, t1, t2, t1 / t2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+from timeit import timeit
+
+from entities import Region
+from geometry import Rect, Vector, Wall
+from physics import PhysicsInterface
+
+# run from the project root:
+#   python -m benchmarks.region_walls
+
+GRID_SIZES = 1, 10, 30, 50      # a grid of n x n boxes, four walls each
+BOX_SIZE = 100
+SPRITES = 100
+FRAMES = 10
+
+
+class BenchSprite:
+    def __init__(self, name, position):
+        self.name = name
+        self.rect = Rect((20, 20), position)
+        self.physics_interface = PhysicsInterface(self)
+
+    def get_velocity(self):
+        return Vector(self.name + " velocity", 3, 2)
+
+    def get_collision_rect(self):
+        return self.rect
+
+    def get_collision_points(self):
+        rect = self.rect
+
+        return [
+            rect.midtop, rect.midright,
+            rect.midleft, rect.midbottom
+        ]
+
+    def get_collision_skeleton(self):
+        rect = self.rect
+        h = Wall(self.name + " h skeleton", rect.midleft, rect.midright)
+        v = Wall(self.name + " v skeleton", rect.midtop, rect.midbottom)
+
+        return h, v
+
+
+def make_region(n, continuous):
+    region = Region("benchmark region")
+    region.set_continuous_collision(continuous)
+    walls = []
+
+    for x in range(n):
+        for y in range(n):
+            l, t = x * BOX_SIZE, y * BOX_SIZE
+            r, b = l + BOX_SIZE, t + BOX_SIZE
+            points = (l, t), (r, t), (r, b), (l, b)
+
+            for i in range(4):
+                walls.append({
+                    "name": "wall {} {} {}".format(x, y, i),
+                    "origin": points[i], "end": points[(i + 1) % 4]})
+
+    region.set_walls(*walls)
+
+    return region
+
+
+def make_sprites(n):
+    return [BenchSprite("sprite {}".format(i),
+                        ((i * 7) % (n * BOX_SIZE - 20),
+                         (i * 13) % (n * BOX_SIZE - 20)))
+            for i in range(SPRITES)]
+
+
+def frame(region, sprites):
+    for s in sprites:
+        region.test_sprite_collision(s)
+
+
+def main():
+    print("{:>8} {:>16} {:>16}".format(
+        "walls", "discrete (ms)", "swept (ms)"))
+
+    for n in GRID_SIZES:
+        sprites = make_sprites(n)
+        times = []
+
+        for continuous in (False, True):
+            region = make_region(n, continuous)
+            t = timeit(lambda: frame(region, sprites), number=FRAMES)
+            times.append(t * 1000 / FRAMES)
+
+        print("{:>8} {:>16.3f} {:>16.3f}".format(
+            len(region.walls), *times))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,20 +1,113 @@
+from array import array
+
+from latency import LatencyMonitor
 from resources import load_resource
 
+# parsed state transition files, shared by every StateMachine that loads
+# them. Each one is the list of states and, for each state, a tuple of
+# (name, method name, logic, to_index, buffer) entries in cfg order
+TRANSITION_DEFINITIONS = {}
+
 
-class CacheList(list):
+class CacheList:
+    """
+    A CacheList keeps the last 'size' items appended to it, and can be
+    indexed, sliced and iterated over like a list, oldest item first.
+
+    The items are kept in a ring buffer, so appending to a full CacheList
+    overwrites the oldest item instead of shifting every item down one.
+    """
     def __init__(self, size):
-        super(CacheList, self).__init__()
         self._size = size
+        self._items = self.make_buffer(size)
+        self._start = 0
+        self._length = 0
+
+    def __repr__(self):
+        return "{}({}): {}".format(
+            type(self).__name__, self._size, self[:])
+
+    def __len__(self):
+        return self._length
+
+    def __iter__(self):
+        return iter(self.get_slice(0, self._length))
+
+    def __getitem__(self, index):
+        if type(index) is slice:
+            start, stop, step = index.indices(self._length)
+
+            if step == 1:
+                return self.get_slice(start, stop)
+
+            return [self[i] for i in range(start, stop, step)]
+
+        if index < 0:
+            index += self._length
+
+        if not 0 <= index < self._length:
+            raise IndexError("CacheList index out of range")
+
+        return self._items[(self._start + index) % self._size]
+
+    # the items from start to stop as a list, made from at most two slices
+    # of the buffer
+    def get_slice(self, start, stop):
+        if stop <= start:
+            return []
+
+        size = self._size
+        items = self._items
+        length = stop - start
+        start = (self._start + start) % size
+        stop = start + length
+
+        if stop <= size:
+            return items[start:stop]
+
+        return items[start:] + items[:stop - size]
+
+    @staticmethod
+    def make_buffer(size):
+        return [None] * size
+
+    # the last k items, oldest first
+    def last(self, k):
+        n = self._length
+
+        return self.get_slice(max(n - k, 0), n)
+
+    def set_size(self, size=None):
+        if size is None:
+            return
+
+        items = self.last(size)
+        self._size = size
+        self._items = self.make_buffer(size)
+        self._start = 0
+        self._length = len(items)
 
-    def set_size(self):
-        if len(self) > self._size:
-            for i in range(len(self) - 1):
-                self[i] = self[i + 1]
-            self.pop()
+        for i, item in enumerate(items):
+            self._items[i] = item
 
     def append(self, p_object):
-        super(CacheList, self).append(p_object)
-        self.set_size()
+        size = self._size
+
+        if not size:
+            return
+
+        if self._length < size:
+            self._items[(self._start + self._length) % size] = p_object
+            self._length += 1
+
+        else:
+            self._items[self._start] = p_object
+            self._start = (self._start + 1) % size
+
+    def clear(self):
+        self._items = self.make_buffer(self._size)
+        self._start = 0
+        self._length = 0
 
     def __iadd__(self, other):
         for item in other:
@@ -23,6 +116,19 @@ class CacheList(list):
         return self
 
 
+class ArrayCache(CacheList):
+    """
+    An ArrayCache is a CacheList of small ints (-128 to 127) that are kept
+    in a signed byte array instead of a list. Slices are returned as lists.
+    """
+    @staticmethod
+    def make_buffer(size):
+        return array("b", bytes(size))
+
+    def get_slice(self, start, stop):
+        return list(super(ArrayCache, self).get_slice(start, stop))
+
+
 class AverageCache(CacheList):
     def average(self):
         if not self:
@@ -512,43 +618,108 @@ class StateMachine:
 
         self._state = None
         self.states = None
+        self.state_indexes = {}
         self.buffer_state = False
 
+        # one tuple of (check, expected, to_index, buffered) entries for each
+        # state index, in reverse cfg order
+        self.transition_table = []
+        self.memoize_checks = False
+
     def set_transitions(self, obj, file_name):
+        if file_name not in TRANSITION_DEFINITIONS:
+            TRANSITION_DEFINITIONS[file_name] = self.load_transitions(
+                file_name)
+
+        states, definitions = TRANSITION_DEFINITIONS[file_name]
+        self.set_states(*states)
+        transitions = {}
+
+        for state in states:
+            entry = {}
+
+            for name, method_name, logic, to_index, buffer in definitions[
+                    state]:
+                t = {"name": name, "to_index": to_index, "buffer": buffer}
+
+                if not logic:
+                    t["logic"] = False
+
+                if not method_name == "auto":
+                    t["check"] = getattr(obj.controller_interface, method_name)
+
+                else:
+                    t["check"] = "auto"
+
+                entry[name] = t
+
+            transitions[state] = entry
+
+        self.transitions = transitions
+        self.compile_transitions()
+
+    @staticmethod
+    def load_transitions(file_name):
         cfg = load_resource(file_name)
 
         states = list(cfg["state_transitions"].keys())
-        self.set_states(*states)
+        indexes = {s: i for i, s in enumerate(states)}
+        definitions = {}
 
         for state in states:
             entry = cfg["state_transitions"][state]
+            entries = []
 
-            for transition in list(entry.keys()):
+            for transition in entry:
                 args = entry[transition]
                 to_state = args[0]
-                t = {}
 
                 method_name = transition
+                logic = True
                 if transition[0:4] == "not_":
                     method_name = transition[4:]
-                    t["logic"] = False
+                    logic = False
 
-                t["name"] = transition
-                t["to_index"] = self.get_state_index(to_state)
-                t["buffer"] = "buffer" in args
+                entries.append((
+                    transition, method_name, logic,
+                    indexes[to_state], "buffer" in args
+                ))
 
-                if not method_name == "auto":
-                    t["check"] = getattr(obj.controller_interface, method_name)
+            definitions[state] = tuple(entries)
 
-                else:
-                    t["check"] = "auto"
+        return tuple(states), definitions
+
+    # the last transition in a state's cfg entry that passes is the one that
+    # fires, so the entries are stored in reverse and update can stop at the
+    # first unbuffered one that passes
+    def compile_transitions(self):
+        table = []
+
+        for state in self.states:
+            entries = []
+
+            for t in self.transitions.get(state, {}).values():
+                check = t["check"]
+                if check == "auto":
+                    check = self.auto
+
+                entries.append((
+                    check, t.get("logic", True),
+                    t["to_index"], t.get("buffer", False)
+                ))
+
+            table.append(tuple(reversed(entries)))
 
-                entry[transition] = t
+        self.transition_table = table
 
-        self.transitions = cfg["state_transitions"]
+    # with memoize_checks set, a check shared by more than one transition of
+    # a state is only called once per update
+    def set_memoize_checks(self, value=True):
+        self.memoize_checks = value
 
     def set_states(self, *states):
         self.states = list(states)
+        self.state_indexes = {s: i for i, s in enumerate(self.states)}
         self._state = Meter(
             "state machine meter",
             0, 0, len(states))
@@ -563,6 +734,9 @@ class StateMachine:
         else:
             raise TypeError("{} not int or str".format(state))
 
+        if LatencyMonitor.ACTIVE and value != self._state.value:
+            LatencyMonitor.ACTIVE.on_state_change(self)
+
         self._state.value = value
         self.buffer_state = False
 
@@ -582,31 +756,40 @@ class StateMachine:
         return check == logic
 
     def get_state_index(self, state):
-        return self.states.index(state)
+        return self.state_indexes[state]
 
     def update(self):
-        transitions = self.transitions[
-            self.get_state()
-        ]
-
         if self.buffer_state is not False:
-            t = {"check": self.auto}
-
-            if self.check_transition(t):
+            if self.auto():
                 self.set_state(self.buffer_state)
                 return
 
-        for t in transitions.values():
-            to_index = t["to_index"]
-            check = self.check_transition(t)
-            buffer = t.get("buffer", False)
+        memo = {} if self.memoize_checks else None
+        buffer_state = False
+
+        for check, expected, to_index, buffered in self.transition_table[
+                self._state.value]:
+            if buffered and buffer_state is not False:
+                continue
+
+            if memo is None:
+                result = bool(check())
 
-            if check:
-                if not buffer:
+            else:
+                result = memo.get(check)
+
+                if result is None:
+                    result = memo[check] = bool(check())
+
+            if result == expected:
+                if not buffered:
                     self.set_state(to_index)
+                    break
 
-                else:
-                    self.buffer_state = to_index
+                buffer_state = to_index
+
+        if buffer_state is not False:
+            self.buffer_state = buffer_state
 
     def auto(self):
         return True
@@ -1,10 +1,210 @@
+from math import ceil
+from time import perf_counter
+
 from entities import Layer
-from physics import PhysicsInterface
-from sprites.animation_sprite import HitboxManager
+from geometry import SpatialHash, SweepAndPrune
+from physics import PhysicsInterface, PhysicsWorld
+from sprites.animation_sprite import AnimationSprite, HitboxManager
 from resources import load_resource
 
+# the vectorized narrowphase works on numpy arrays, so it's only available if
+# numpy is installed
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+class ContactCache:
+    """
+    A ContactCache keeps the contact state of each pair tested by a collision
+    system across frames, keyed by the ids of the two items.
+
+    Pairs that start touching fire an 'on_collision_enter' event on both
+    items, pairs that stay touching fire 'on_collision_stay' and pairs that
+    stop touching, or stop being tested, fire 'on_collision_exit'. Each event
+    has the other item under 'other' and the system's name under
+    'collision_system'.
+
+    When a pair is found apart the gap between their bounds is stored, and
+    the narrowphase is skipped on later frames while the distance both items
+    have moved since then is less than that gap, minus a margin. Changing
+    animation frame can change a sprite's hitboxes, so that forces a retest.
+    """
+    MARGIN = 2
+
+    def __init__(self, name, get_bounds):
+        self.name = name
+        self.get_bounds = get_bounds
+
+        self.contacts = {}
+        self.frame = 0
+        self.skipped = 0
+
+    def __len__(self):
+        return len(self.contacts)
+
+    def clear(self):
+        self.contacts = {}
+
+    @staticmethod
+    def get_key(item, other):
+        a, b = id(item), id(other)
+
+        if a < b:
+            return a, b
+        else:
+            return b, a
+
+    @staticmethod
+    def get_snapshot(item):
+        m = item.animation_machine
+
+        return (
+            item.position, item.get_last_position(),
+            m.get_animation_state(), m.get_animation_frame()
+        )
+
+    @staticmethod
+    def get_gap(b1, b2):
+        l1, t1, r1, bt1 = b1
+        l2, t2, r2, bt2 = b2
+
+        return max(l2 - r1, l1 - r2, t2 - bt1, t1 - bt2)
+
+    @staticmethod
+    def get_movement(snapshot, item):
+        (x1, y1), (lx1, ly1), state, frame = snapshot
+        (x2, y2), (lx2, ly2), state2, frame2 = ContactCache.get_snapshot(item)
+
+        if state != state2 or frame != frame2:
+            return None
+
+        return max(
+            abs(x2 - x1), abs(y2 - y1), abs(lx2 - lx1), abs(ly2 - ly1))
+
+    # a separated pair can be skipped if neither item has changed animation
+    # frame and they haven't moved far enough to close the gap between them
+    def check_separated(self, contact):
+        item, other, touching, gap, s1, s2 = contact[:6]
+        m1 = self.get_movement(s1, item)
+        m2 = self.get_movement(s2, other)
+
+        if m1 is None or m2 is None:
+            return False
+
+        return gap - (m1 + m2) > self.MARGIN
+
+    def handle_contact_event(self, name, item, other):
+        for a, b in ((item, other), (other, item)):
+            a.handle_event({
+                "name": name, "other": b,
+                "collision_system": self.name
+            })
+
+    def start_frame(self):
+        self.frame += 1
+        self.skipped = 0
+
+    # marks a pair as tested this frame without testing it, for pairs that
+    # are both asleep
+    def keep(self, item, other):
+        contact = self.contacts.get(self.get_key(item, other))
+
+        if contact:
+            contact[6] = self.frame
+
+    # returns the collision and whether the pair just started touching
+    def test(self, item, other, test):
+        key = self.get_key(item, other)
+        contact = self.contacts.get(key)
+
+        if contact and not contact[2] and self.check_separated(contact):
+            contact[6] = self.frame
+            self.skipped += 1
+
+            return False, False
+
+        collision = test(item, other)
+        was_touching = contact and contact[2]
+
+        if collision:
+            self.contacts[key] = [
+                item, other, True, 0, None, None, self.frame]
+
+            if was_touching:
+                self.handle_contact_event(
+                    "on_collision_stay", item, other)
+
+            else:
+                self.handle_contact_event(
+                    "on_collision_enter", item, other)
+
+        else:
+            gap = self.get_gap(
+                self.get_bounds(item), self.get_bounds(other))
+            self.contacts[key] = [
+                item, other, False, gap,
+                self.get_snapshot(item), self.get_snapshot(other),
+                self.frame]
+
+            if was_touching:
+                self.handle_contact_event(
+                    "on_collision_exit", item, other)
+
+        return collision, collision and not was_touching
+
+    # drops pairs that weren't tested this frame, firing exit events for the
+    # ones that were touching. A broadphase that keeps its pairs between
+    # frames passes the pairs that stopped overlapping, and only those are
+    # dropped instead of checking every contact
+    def end_frame(self, removed=None):
+        contacts = self.contacts
+
+        if removed is None:
+            frame = self.frame
+            keys = [k for k in contacts if contacts[k][6] != frame]
+
+        else:
+            keys = [self.get_key(item, other) for item, other in removed]
+
+        for key in keys:
+            contact = contacts.pop(key, None)
+
+            if contact and contact[2]:
+                self.handle_contact_event(
+                    "on_collision_exit", contact[0], contact[1])
+
 
 class CollisionManager:
+    """
+    A CollisionManager runs one collision system over one or two groups.
+    Systems can use a broadphase, set with the 'broadphase' key of the
+    collision system's cfg entry, so that only pairs whose bounds overlap
+    are passed to the system instead of every pair.
+
+    'spatial_hash' works for single group systems. 'sweep_and_prune' works
+    for single and two group systems.
+
+    Single group systems keep a ContactCache, so they fire collision enter,
+    stay and exit events, and hitboxes are only handled when they first hit.
+
+    'narrowphase: vectorized' makes a sprite_sprite system test every pair of
+    collision rects at once with numpy instead of looping over pairs, which
+    suits groups of a few hundred sprites where a broadphase costs more
+    than it saves.
+
+    A system's 'mask' key takes collision category names, and items of
+    group_a whose category isn't in the mask are left out before the
+    broadphase. Pairs are also skipped before any geometric test unless
+    each item's category is in the other's collision mask.
+
+    With 'in_view_only: true', sprites that a camera with level of detail on
+    has marked out of view are left out before the broadphase too. This
+    changes gameplay, since those sprites stop colliding, so it's off by
+    default and out of view sprites are tested the same as any other.
+    """
     def __init__(self, name):
         self.name = name
 
@@ -12,18 +212,51 @@ class CollisionManager:
         self.group_a = []
         self.group_b = []
 
+        self.broadphase = None
+        self.get_bounds = None
+        self.get_bounds_b = None
+        self.pairs_tested = 0
+        self.contacts = None
+        self.mask = None
+        self.in_view_only = False
+
     def __repr__(self):
         return "CollisionManager: {}".format(self.name)
 
     def update(self):
         if self.collision_system:
+            group_a = self.group_a
+            if self.mask is not None:
+                group_a = self.get_masked_items(group_a)
+
+            if self.in_view_only:
+                group_a = self.get_in_view_items(group_a)
+
+            pairs = None
+            if self.broadphase is not None:
+                pairs = self.get_broadphase_pairs(group_a)
+
             if self.group_b:
-                self.collision_system(
-                    self.group_a, self.group_b)
+                self.pairs_tested = self.collision_system(
+                    group_a, self.group_b, pairs=pairs)
 
             else:
-                self.collision_system(
-                    self.group_a)
+                contacts = self.contacts
+                if contacts is not None:
+                    contacts.start_frame()
+
+                self.pairs_tested = self.collision_system(
+                    group_a, pairs=pairs, contacts=contacts)
+
+                if contacts is not None:
+                    removed = None
+                    if isinstance(self.broadphase, SweepAndPrune):
+                        removed = self.broadphase.removed
+
+                    contacts.end_frame(removed)
+
+    def get_pairs_tested(self):
+        return self.pairs_tested
 
     def set_group_a(self, group):
         self.group_a = group
@@ -31,41 +264,199 @@ class CollisionManager:
     def set_group_b(self, group):
         self.group_b = group
 
+    def get_masked_items(self, group):
+        mask = self.mask
+
+        return [item for item in group if item.collision_category & mask]
+
+    @staticmethod
+    def get_in_view_items(group):
+        return [item for item in group if item.is_in_view()]
+
+    def get_broadphase_pairs(self, group_a):
+        get_bounds = self.get_bounds
+        entries = [(item, get_bounds(item)) for item in group_a]
+
+        if self.group_b:
+            get_bounds = self.get_bounds_b
+            self.broadphase.set_items(
+                entries, [(item, get_bounds(item)) for item in self.group_b])
+
+        else:
+            self.broadphase.set_items(entries)
+
+        return self.broadphase.get_pairs()
+
+    @staticmethod
+    def get_collision_bounds(sprite):
+        return sprite.get_collision_rect().get_bounds()
+
     @staticmethod
-    def sprite_region_collision_system(sprites, regions):
-        for sprite in sprites:
-            for region in regions:
-                collision = region.test_sprite_collision(sprite)
+    def get_swept_bounds(sprite):
+        rect = sprite.get_collision_rect()
 
-                if collision:
-                    region.handle_sprite_collision(sprite, collision)
+        return rect.get_swept_bounds(sprite.get_velocity().get_value())
 
     @staticmethod
-    def group_perm_collision_system(group, test, handle):
-        tested = []
-        for item in group:
-            tested.append(item)
+    def get_region_bounds(region):
+        return region.get_wall_bounds()
+
+    @staticmethod
+    def get_all_pairs(group):
+        items = list(group)
+
+        for i in range(len(items) - 1):
+            item = items[i]
+
+            for other in items[i + 1:]:
+                yield item, other
+
+    @staticmethod
+    def sprite_region_collision_system(sprites, regions, pairs=None):
+        if pairs is None:
+            pairs = [(s, r) for s in sprites for r in regions]
+
+        tested = 0
+
+        for sprite, region in pairs:
+            if sprite.is_still():
+                continue
+
+            tested += 1
+            collision = region.test_sprite_collision(sprite)
 
-            for other in [o for o in group if o not in tested]:
+            if collision:
+                region.handle_sprite_collision(sprite, collision)
+
+        return tested
+
+    # with a contact cache, handle_on_enter only handles a collision on the
+    # frame the pair starts touching. The number of narrowphase tests run
+    # is returned
+    @staticmethod
+    def group_perm_collision_system(group, test, handle, pairs=None,
+                                    contacts=None, handle_on_enter=False):
+        if pairs is None:
+            pairs = CollisionManager.get_all_pairs(group)
+
+        check_mask = AnimationSprite.check_collision_mask
+        tested = 0
+
+        for item, other in pairs:
+            if not check_mask(item, other):
+                continue
+
+            if item.is_asleep() and other.is_asleep():
+                if contacts is not None:
+                    contacts.keep(item, other)
+
+                continue
+
+            tested += 1
+
+            if contacts is not None:
+                collision, entered = contacts.test(item, other, test)
+
+                if handle_on_enter and not entered:
+                    collision = False
+
+            else:
                 collision = test(item, other)
 
-                if collision and handle:
-                    handle(item, other, collision)
+            if collision and handle:
+                handle(item, other, collision)
+
+        if contacts is not None:
+            tested -= contacts.skipped
+
+        return tested
 
     @staticmethod
-    def sprite_sprite_collision_system(group):
+    def sprite_sprite_collision_system(group, pairs=None, contacts=None):
         test = PhysicsInterface.test_sprite_collision
         handle = PhysicsInterface.handle_sprite_collision
 
-        CollisionManager.group_perm_collision_system(
-            group, test, handle)
+        return CollisionManager.group_perm_collision_system(
+            group, test, handle, pairs, contacts)
 
+    # finds every overlapping pair of collision rects in the group and the
+    # center of their overlap in one pass. Rects are truncated to ints the
+    # way pygame does, so the results match Rect.get_rect_collision
     @staticmethod
-    def sprite_hitbox_collision_system(group):
-        test = HitboxManager.do_hitbox_collision
+    def get_overlapping_pairs(group):
+        items = list(group)
+        if len(items) < 2:
+            return []
+
+        rects = [item.get_collision_rect() for item in items]
+        a = np.array(
+            [r.position + r.size for r in rects], dtype=float).astype(int)
 
-        CollisionManager.group_perm_collision_system(
-            group, test, None)
+        left, top = a[:, 0], a[:, 1]
+        right, bottom = left + a[:, 2], top + a[:, 3]
+
+        clip_l = np.maximum(left[:, None], left[None, :])
+        clip_t = np.maximum(top[:, None], top[None, :])
+        clip_w = np.minimum(right[:, None], right[None, :]) - clip_l
+        clip_h = np.minimum(bottom[:, None], bottom[None, :]) - clip_t
+
+        overlap = np.triu((clip_w > 0) & (clip_h > 0), 1)
+        i, j = np.nonzero(overlap)
+
+        cx = clip_l[i, j] + (clip_w[i, j] // 2)
+        cy = clip_t[i, j] + (clip_h[i, j] // 2)
+
+        return [
+            (items[a], items[b], (x, y)) for a, b, x, y in
+            zip(i.tolist(), j.tolist(), cx.tolist(), cy.tolist())
+        ]
+
+    # with a broadphase the pairs are already few, so they're tested in the
+    # regular loop
+    @staticmethod
+    def vectorized_sprite_sprite_collision_system(
+            group, pairs=None, contacts=None):
+        if pairs is not None:
+            return CollisionManager.sprite_sprite_collision_system(
+                group, pairs, contacts)
+
+        overlaps = CollisionManager.get_overlapping_pairs(group)
+        collisions = {
+            (id(item), id(other)): c for item, other, c in overlaps}
+
+        def test(item, other):
+            return collisions[(id(item), id(other))]
+
+        handle = PhysicsInterface.handle_sprite_collision
+
+        return CollisionManager.group_perm_collision_system(
+            group, test, handle,
+            [(item, other) for item, other, c in overlaps], contacts)
+
+    @staticmethod
+    def sprite_hitbox_collision_system(group, pairs=None, contacts=None):
+        test = HitboxManager.test_hitbox_collision
+        handle = HitboxManager.handle_hitbox_collision
+
+        return CollisionManager.group_perm_collision_system(
+            group, test, handle, pairs, contacts, handle_on_enter=True)
+
+    @staticmethod
+    def get_broadphase(d):
+        name = d["broadphase"]
+
+        if name == "spatial_hash":
+            if d.get("group_b"):
+                raise ValueError(
+                    "spatial_hash broadphase needs a single group system")
+
+            return SpatialHash(
+                d.get("cell_size", SpatialHash.CELL_SIZE))
+
+        if name == "sweep_and_prune":
+            return SweepAndPrune()
+
+        raise ValueError("bad broadphase name {}".format(name))
 
     @staticmethod
     def get_from_dict(d):
@@ -74,18 +465,122 @@ class CollisionManager:
         cm.group_a = d["group_a"]
         cm.group_b = d.get("group_b", [])
 
-        system_name = d["collision_system"] + "_collision_system"
-        cm.collision_system = getattr(CollisionManager, system_name)
+        system_name = d["collision_system"]
+        cm.collision_system = getattr(
+            CollisionManager, system_name + "_collision_system")
+
+        if d.get("narrowphase") == "vectorized":
+            if system_name != "sprite_sprite":
+                raise ValueError(
+                    "vectorized narrowphase needs a sprite_sprite system")
+
+            if np is None:
+                raise ImportError("vectorized narrowphase requires numpy")
+
+            cm.collision_system = (
+                CollisionManager.vectorized_sprite_sprite_collision_system)
+
+        cm.get_bounds, cm.get_bounds_b = BOUNDS_DICT[system_name]
+
+        if "broadphase" in d:
+            cm.broadphase = CollisionManager.get_broadphase(d)
+
+        if "mask" in d:
+            mask = d["mask"]
+            if type(mask) is not list:
+                mask = [mask]
+
+            cm.mask = AnimationSprite.get_collision_bits(mask)
+
+        cm.in_view_only = d.get("in_view_only", False)
+
+        if not cm.group_b:
+            cm.contacts = ContactCache(cm.name, cm.get_bounds)
 
         return cm
 
 
+BOUNDS_DICT = {
+    "sprite_region": (
+        CollisionManager.get_swept_bounds,
+        CollisionManager.get_region_bounds
+    ),
+    "sprite_sprite": (CollisionManager.get_collision_bounds, None),
+    "sprite_hitbox": (HitboxManager.get_hitbox_bounds, None)
+}
+
+
 class CollisionLayer(Layer):
     def __init__(self, name):
         super(CollisionLayer, self).__init__(name)
 
         self.collision_systems = []
 
+        self.physics_world = None
+        self.physics_groups = []
+
+        self.physics_steps = 1
+        self.adaptive_steps = False
+        self.physics_budget = None
+        self.steps_used = 0
+
+    def set_physics_world(self, *groups):
+        self.physics_world = PhysicsWorld(self.name + " physics world")
+
+        for g in groups:
+            if type(g) is str:
+                g = self.model[g]
+
+            self.physics_groups.append(g)
+
+    # physics_steps: 4             -> four substeps per frame
+    # physics_steps: adaptive, 8   -> one to eight substeps, picked each frame
+    #                                 from the fastest body's speed and the
+    #                                 smallest collision rect
+    # substeps only apply to bodies in the layer's physics world
+    def set_physics_steps(self, *args):
+        if args[0] == "adaptive":
+            self.adaptive_steps = True
+            args = args[1:]
+
+        if args:
+            self.physics_steps = args[0]
+
+    # time budget in milliseconds for the whole physics update. Once a frame
+    # has spent its budget the rest of the frame is integrated in one step
+    def set_physics_budget(self, ms):
+        self.physics_budget = ms / 1000
+
+    def get_physics_steps(self):
+        return self.steps_used
+
+    def get_pairs_tested(self):
+        return sum([s.pairs_tested for s in self.collision_systems])
+
+    # enough substeps that the fastest body moves less than the smallest
+    # awake body's size in each one
+    def get_adaptive_steps(self):
+        world = self.physics_world
+        speed = world.get_max_speed()
+
+        if not speed:
+            return 1
+
+        size = world.get_min_size()
+
+        if size <= 0:
+            return self.physics_steps
+
+        return max(1, min(self.physics_steps, ceil(speed / size)))
+
+    def get_physics_items(self):
+        items = []
+
+        for g in self.physics_groups:
+            items += [i for i in g if hasattr(i, "physics_interface")]
+
+        return items
+
     def set_collisions(self, *systems):
         for s in systems:
             if type(s) is str:
@@ -106,11 +601,48 @@ class CollisionLayer(Layer):
         um = super(CollisionLayer, self).get_update_methods()
 
         um += [
-            self.update_collision_systems
+            self.update_physics
         ]
 
         return um
 
+    def update_physics(self):
+        world = self.physics_world
+
+        if not world or self.paused:
+            self.steps_used = 0
+            self.update_collision_systems()
+            return
+
+        world.set_bodies(self.get_physics_items())
+
+        if self.adaptive_steps:
+            steps = self.get_adaptive_steps()
+        else:
+            steps = self.physics_steps
+
+        budget = self.physics_budget
+        start = perf_counter()
+        remaining = 1
+        used = 0
+
+        while remaining > 0:
+            dt = remaining / (steps - used)
+
+            if used and budget:
+                spent = perf_counter() - start
+                if spent + (spent / used) > budget:
+                    dt = remaining
+                    self.log("physics budget spent after {} of {} steps".format(
+                        used, steps))
+
+            remaining -= dt
+            world.step(dt, last=remaining <= 0, first=not used)
+            self.update_collision_systems()
+            used += 1
+
+        self.steps_used = used
+
     def update_collision_systems(self):
         for system in self.collision_systems:
             system.update()
@@ -1,8 +1,10 @@
-from classes import CacheList
+from classes import ArrayCache, CacheList
 from input_manager import ButtonMappingKey, ButtonMappingButton, ButtonMappingAxis, ButtonMappingHat
+from input_manager import InputSnapshot
+from latency import LatencyMonitor
 from resources import load_resource
 from zs_constants import CONTROLLER_FRAME_DEPTH as SIZE
-from zs_constants import INIT_DELAY, HELD_DELAY, UDLR
+from zs_constants import INIT_DELAY, HELD_DELAY, CHARGE_TIME, UDLR
 
 
 #
@@ -14,17 +16,31 @@ class Controller:
     The Controller object represents a virtual blueprint for a set of input devices
     that will be used for a given game environment. It has a list of input device objects
     and a mapping dictionary that pairs each device with a mapping object that produces the
-    input value for a given frame. All of that data is stored in a frame cache by the controller
-    object.
+    input value for a given frame. Each device keeps the frame cache of its own values, and the
+    controller looks devices up by name through an index dict.
     """
+    # an InputRecorder and InputReplay shared by every controller, see input_recorder.py
+    RECORDER = None
+    REPLAY = None
+
     def __init__(self, name):
         self.name = name
-        self.frames = CacheList(SIZE)
 
         self.devices = []
+        self.device_indexes = {}
         self.mappings = {}
         self.commands = {}
 
+        # the number of frames recorded, and the InputSnapshot frame the
+        # controller was last updated on
+        self.frame_count = 0
+        self.frame = None
+
+        # the last frame's values and the InputSnapshot version they were
+        # read at, reused while the input hasn't changed
+        self.last_values = None
+        self.version = None
+
     def __repr__(self):
         c = self.__class__.__name__
         n = self.name
@@ -33,29 +49,26 @@ class Controller:
 
     # returns list index for a given device name
     def get_device_index(self, name):
-        for d in self.devices:
-            if d.name == name:
-                return self.devices.index(d)
+        return self.device_indexes.get(name)
 
     # returns device object for a given device name
     def get_device(self, name):
         return self.devices[
-            self.get_device_index(name)
+            self.device_indexes[name]
         ]
 
-    # returns a frame cache with data for a given device
-    def get_device_frames(self, name):
-        output = []
-        i = self.get_device_index(name)
-
-        for frame in self.frames:
-            output.append(frame[i])
+    # returns the frame data for a given device, see InputDevice.get_frames
+    def get_device_frames(self, name, k=None):
+        return self.get_device(name).get_frames(k)
 
-        return output
+    # returns the frame data for every device on the latest frame
+    def get_frame(self):
+        return [d.get_value() for d in self.devices]
 
     # add a device / input mapping to the controller object
     def add_device(self, device, mapping):
         self.mappings[device.name] = mapping
+        self.device_indexes[device.name] = len(self.devices)
         self.devices.append(device)
 
         if type(device) is Dpad:
@@ -65,12 +78,26 @@ class Controller:
             for i in range(4):
                 self.add_device(buttons[i], mapping[i])
 
+    # returns True if any device has a non-default value on the latest frame
+    def is_active(self):
+        for d in self.devices:
+            if d.frames and d.frames[-1] != d.default:
+                return True
+
+        return False
+
     def get_command_frames(self, *device_names):
         device_frames = [self.get_device_frames(n) for n in device_names]
         frames = tuple(zip(*device_frames))
 
         return frames
 
+    # the values of the given devices on the latest frame
+    def get_command_frame(self, *device_names):
+        return tuple(
+            self.get_device(n).get_value() for n in device_names
+        )
+
     def check_command(self, name):
         return self.commands[name].active
 
@@ -90,34 +117,58 @@ class Controller:
             d.update()
 
         for command in self.commands.values():
-            frames = self.get_command_frames(*command.devices)
-            command.update(frames[-1])
+            command.update(
+                self.get_command_frame(*command.devices))
+
+    # update once for each InputSnapshot frame, however many entities share
+    # the controller
+    def update_for_frame(self):
+        frame = InputSnapshot.frame
 
-    # append frame data to frame cache object
+        if self.frame != frame:
+            self.frame = frame
+            self.update()
+
+    # append frame data to each device's frame cache. With a REPLAY set the data comes from
+    # an input recording instead of the mappings, and with a RECORDER set it's written to one
     def update_frames(self):
-        frame = []
+        self.frame_count += 1
+        devices = self.devices
 
-        for d in self.devices:
-            m = self.mappings[d.name]
+        if Controller.REPLAY:
+            values = Controller.REPLAY.get_values(self)
 
-            frame.append(
-                d.get_input(m)
-            )
+        elif self.version == InputSnapshot.version and self.last_values:
+            values = self.last_values
+
+        else:
+            mappings = self.mappings
+            values = [d.get_input(mappings[d.name]) for d in devices]
+            self.last_values = values
+            self.version = InputSnapshot.version
+
+        if Controller.RECORDER:
+            Controller.RECORDER.record(self, values)
 
-        self.frames.append(frame)
+        if LatencyMonitor.ACTIVE:
+            LatencyMonitor.ACTIVE.on_input(self, values)
+
+        for d, value in zip(devices, values):
+            d.frames.append(value)
 
 
 class InputDevice:
     """
     This abstract superclass defines the main methods of the input device object.
-    Each device is paired with a controller object which is used to access the frame cache, and
-    some devices have additional attributes that can be altered by the update method based on this
-    data. Each device also defines a get_input method for producing frame data.
+    Each device is paired with a controller object and keeps a frame cache of its own input values,
+    and some devices have additional attributes that can be altered by the update method based on
+    this data. Each device also defines a get_input method for producing frame data.
     """
     def __init__(self, name, controller):
         self.name = name
         self.default = None
         self.controller = controller
+        self.frames = self.make_frame_cache()
 
     def __repr__(self):
         c = self.__class__.__name__
@@ -125,14 +176,31 @@ class InputDevice:
 
         return "{}: '{}'".format(c, n)
 
-    # get frame cache for this device
-    def get_frames(self):
-        return self.controller.get_device_frames(self.name)
+    @staticmethod
+    def make_frame_cache():
+        return CacheList(SIZE)
+
+    # get the frame cache for this device, oldest frame first. It's the cache
+    # itself rather than a copy, so it shouldn't be changed. With k, a list
+    # of just the last k frames is returned
+    def get_frames(self, k=None):
+        if k is None:
+            return self.frames
+
+        return self.frames.last(k)
 
     # get most recent value from frame cache
     def get_value(self):
-        if self.get_frames():
-            return self.get_frames()[-1]
+        if self.frames:
+            return self.frames[-1]
+
+        else:
+            return self.default
+
+    # get the value from the frame before the most recent one
+    def get_last_value(self):
+        if len(self.frames) > 1:
+            return self.frames[-2]
 
         else:
             return self.default
@@ -163,7 +231,13 @@ class Button(InputDevice):
         self.held = 0
         self.default = 0
 
-        self.lifted = False
+        # the controller frame the button was last seen released on
+        self.last_up = -1
+
+    # button frame data is kept in a byte array
+    @staticmethod
+    def make_frame_cache():
+        return ArrayCache(SIZE)
 
     # ignore / check give a method for getting discrete input intervals from a
     # continuous button push.
@@ -183,6 +257,12 @@ class Button(InputDevice):
 
         return ignore
 
+    # a button only counts as lifted once it's been seen released, so one
+    # held when the controller was made doesn't fire until it's pressed again
+    @property
+    def lifted(self):
+        return self.last_up >= 0
+
     def check(self):
         if self.lifted:
             return self.held and not self.ignore
@@ -190,8 +270,7 @@ class Button(InputDevice):
     # negative_edge returns True if a button was pushed the last frame and has just
     # been released. It returns False in all other cases.
     def negative_edge(self):
-        frames = self.get_frames()
-        current, last = frames[-1], frames[-2]
+        current, last = self.get_value(), self.get_last_value()
 
         return last and not current
 
@@ -203,13 +282,11 @@ class Button(InputDevice):
         return int(mapping.is_pressed())
 
     def update(self):
-        if not self.lifted:
-            self.lifted = 0 in self.get_frames()
-
         if self.get_value():
             self.held += 1
         else:
             self.held = 0
+            self.last_up = self.controller.frame_count
 
 
 class Dpad(InputDevice):
@@ -224,6 +301,12 @@ class Dpad(InputDevice):
         super(Dpad, self).__init__(name, controller)
         self.last_direction = (1, 0)
         self.default = (0, 0)
+        self.d_buttons = []
+
+    # dpad frame data is kept in a byte array as one code per direction
+    @staticmethod
+    def make_frame_cache():
+        return DirectionCache(SIZE)
 
     def get_d_button(self, direction):
         return self.controller.get_device(
@@ -239,32 +322,29 @@ class Dpad(InputDevice):
                 Button(name, self.controller)
             )
 
+        self.d_buttons = buttons
+
         return buttons
 
     @property
     def up(self):
-        return self.get_d_button("up")
+        return self.d_buttons[0]
 
     @property
     def down(self):
-        return self.get_d_button("down")
+        return self.d_buttons[1]
 
     @property
     def left(self):
-        return self.get_d_button("left")
+        return self.d_buttons[2]
 
     @property
     def right(self):
-        return self.get_d_button("right")
+        return self.d_buttons[3]
 
     @property
     def buttons(self):
-        return [
-            self.up,
-            self.down,
-            self.left,
-            self.right
-        ]
+        return list(self.d_buttons)
 
     @property
     def held(self):
@@ -276,9 +356,11 @@ class Dpad(InputDevice):
 
     # returns the direction button that has been held for the most frames
     def get_dominant(self):
-        u, d, l, r = self.buttons
+        dominant = None
 
-        dominant = sorted([u, d, l, r], key=lambda b: b.held * -1)[0]
+        for b in self.d_buttons:
+            if not dominant or b.held > dominant.held:
+                dominant = b
 
         return dominant
 
@@ -308,105 +390,157 @@ class Dpad(InputDevice):
             self.last_direction = x, y
 
 
+class DirectionCache(ArrayCache):
+    """
+    A DirectionCache keeps Dpad frame data in a byte array, with each (x, y)
+    direction stored as the code (x + 1) * 3 + (y + 1).
+    """
+    DIRECTIONS = tuple((x, y) for x in (-1, 0, 1) for y in (-1, 0, 1))
+
+    def __getitem__(self, index):
+        if type(index) is slice:
+            return super(DirectionCache, self).__getitem__(index)
+
+        return self.DIRECTIONS[
+            super(DirectionCache, self).__getitem__(index)]
+
+    def get_slice(self, start, stop):
+        directions = self.DIRECTIONS
+
+        return [directions[c] for c in super(
+            DirectionCache, self).get_slice(start, stop)]
+
+    def append(self, p_object):
+        x, y = p_object
+        super(DirectionCache, self).append((x + 1) * 3 + (y + 1))
+
+
 class Command:
+    """
+    A Command object recognizes a sequence of steps on a set of devices, such as a double tap
+    or a quarter circle, one frame at a time. Each step's satisfied on a frame when its
+    conditions have been met, and the command is active when every step has been satisfied
+    in order, with the first one no more than 'frame_window' frames ago.
+    Rather than re-checking the whole window, the command keeps, for each step, the frame on
+    which the latest-starting partial match up to that step began, so each update is O(steps).
+    A command that becomes active doesn't reuse any of the frames that made up its match.
+    """
     def __init__(self, name, steps, device_names, frame_window=0):
         self.name = name
         self.steps = steps
         if not frame_window:
             frame_window = sum([step.frame_window for step in steps])
         self.frame_window = frame_window
-        self.frames = CacheList(frame_window)
         self.devices = device_names
         self.active = False
 
-    def check(self):
-        frames = self.frames
-        l = len(frames)
-        i = 0
-        for step in self.steps:
-            sub_slice = frames[i:l]
-            j = step.check(sub_slice)
-            step.last = j
-            i += j
-            if j == 0:
-                return False
+        self.frame = -1
+        self.floor = 0
+        self.starts = [-1] * len(steps)
 
-        return True
+    def reset(self):
+        self.floor = self.frame + 1
+        self.starts = [-1] * len(self.steps)
+
+        for step in self.steps:
+            step.reset()
 
     def update(self, frame):
-        self.frames.append(frame)
-        c = self.check()
-        self.active = c
+        self.frame += 1
+        t = self.frame
+        starts = self.starts
+        steps = self.steps
+
+        # later steps go first, so each step only extends matches that
+        # ended on an earlier frame
+        for k in range(len(steps) - 1, -1, -1):
+            if steps[k].update(frame, t):
+                start = t if k == 0 else starts[k - 1]
+
+                if start > starts[k]:
+                    starts[k] = start
 
-        if c:
-            self.frames.clear()
+        floor = max(self.floor, t - self.frame_window + 1)
+        self.active = starts[-1] >= floor
+
+        if self.active:
+            self.reset()
+
+    def check(self):
+        return self.active
 
     def __repr__(self):
         return self.name
 
 
 class Step:
-    # condition: check_func
-    # check_func: function(frame) => Bool
-
-    def __init__(self, name, conditions, frame_window=1):
+    """
+    A Step object is one part of a Command. Each condition is a function that takes a frame of
+    device values and returns a bool. The step is satisfied on a frame when each condition has
+    been True on at least one of the last 'frame_window' frames, and all of them have been True
+    together for the last 'hold' frames, which is how charge inputs are made.
+    """
+    def __init__(self, name, conditions, frame_window=1, hold=1):
         self.name = name
         self.conditions = conditions
         self.frame_window = frame_window
-        self.last = 0
-
-    def get_matrix(self, frames):
-        frame_matrix = []
-        conditions = self.conditions
-
-        for con in conditions:
-            check = con
-            row = [check(frame) for frame in frames]
-            frame_matrix.append(row)
+        self.hold = hold
 
-        return frame_matrix
+        self.last_true = []
+        self.run = 0
+        self.reset()
 
-    def get_sub_matrix(self, frame_matrix, i):
-        conditions = self.conditions
-        fw = self.frame_window
-        sub_matrix = []
+    def reset(self):
+        self.last_true = [-1 - self.frame_window] * len(self.conditions)
+        self.run = 0
 
-        for con in conditions:
-            row_i = conditions.index(con)
-            row = frame_matrix[row_i][i:i + fw]
-            sub_matrix.append(row)
+    def update(self, frame, t):
+        last_true = self.last_true
+        every = True
 
-        return sub_matrix
+        for i, check in enumerate(self.conditions):
+            if check(frame):
+                last_true[i] = t
+            else:
+                every = False
 
-    def check(self, frames):
-        frame_matrix = self.get_matrix(frames)
-        fw = self.frame_window
-        fl = len(frames)
+        if every:
+            self.run += 1
+        else:
+            self.run = 0
 
-        for i in range((fl - fw) + 1):
-            sub_matrix = self.get_sub_matrix(frame_matrix, i)
-            truth = all([any(row) for row in sub_matrix])
+        first = t - self.frame_window + 1
 
-            if truth:
-                return i + 1
-        return 0
+        return self.run >= self.hold and min(last_true) >= first
 
     @staticmethod
     def get_step_from_key(key):
-        conditions, window = STEP_DICT[key]
-
-        return Step(key, conditions, window)
+        return Step(key, *STEP_DICT[key])
 
     def __repr__(self):
         d, fw = self.name, self.frame_window
 
         return "{}, frame window: {}".format(d, fw)
 
+
+# STEP_DICT entries are (conditions, frame window) or (conditions, frame window, hold).
+# Conditions look at the command's first device, a Dpad, as f[0], and 'press' looks at its
+# second device, a button, as f[1]
 STEP_DICT = {
     "neutral": ([lambda f: f[0] == (0, 0)], 1),
     "up": ([lambda f: f[0][1] == -1], 1),
+    "down": ([lambda f: f[0][1] == 1], 1),
     "left": ([lambda f: f[0][0] == -1], 1),
-    "right": ([lambda f: f[0][0] == 1], 1)
+    "right": ([lambda f: f[0][0] == 1], 1),
+    "up_left": ([lambda f: f[0] == (-1, -1)], 1),
+    "up_right": ([lambda f: f[0] == (1, -1)], 1),
+    "down_left": ([lambda f: f[0] == (-1, 1)], 1),
+    "down_right": ([lambda f: f[0] == (1, 1)], 1),
+    "charge_up": ([lambda f: f[0][1] == -1], 1, CHARGE_TIME),
+    "charge_down": ([lambda f: f[0][1] == 1], 1, CHARGE_TIME),
+    "charge_left": ([lambda f: f[0][0] == -1], 1, CHARGE_TIME),
+    "charge_right": ([lambda f: f[0][0] == 1], 1, CHARGE_TIME),
+    "press": ([lambda f: f[1] == 1], 1)
 }
 
 #
@@ -485,3 +619,145 @@ def get_mapping(d):
             )
 
         return mappings
+
+
+#
+# shared controller objects, and the views of them held by entities
+#
+
+class ControllerRegistry:
+    """
+    The ControllerRegistry holds one Controller object for each controller cfg name, so
+    every entity given that controller shares the same devices and frame cache instead of
+    polling the same physical device with its own copy. Entities hold ControllerView objects
+    of the shared controllers. Controllers made from a devices dict, like the controller
+    menu's remaps, aren't registered, so they only affect the entity they're given to.
+    """
+    CONTROLLERS = {}
+
+    @staticmethod
+    def get_controller(name):
+        controllers = ControllerRegistry.CONTROLLERS
+
+        if name not in controllers:
+            controllers[name] = load_controller(name)
+
+        return controllers[name]
+
+    @staticmethod
+    def get_view(name):
+        return ControllerView(
+            ControllerRegistry.get_controller(name))
+
+    # returns a view of a controller made from a devices dict that isn't
+    # shared, so edits like unsaved remaps stay with the entity given it
+    @staticmethod
+    def get_local_view(name, devices):
+        return ControllerView(
+            make_controller(name, devices))
+
+    @staticmethod
+    def clear():
+        ControllerRegistry.CONTROLLERS = {}
+
+
+class ControllerView:
+    """
+    A ControllerView is an entity's handle on a shared Controller object. Updating a view
+    updates the shared controller once per frame, and then the view's own command inputs.
+    The devices it returns treat buttons as lifted only once they've been released since the
+    view was made, the same as a newly loaded controller would, so a button held while
+    control is passed doesn't carry over to the new view.
+    Anything else is looked up on the shared controller.
+    """
+    def __init__(self, controller):
+        self.controller = controller
+        self.commands = {}
+        self.start = controller.frame_count
+
+        self.device_views = {}
+
+    def __repr__(self):
+        c = self.__class__.__name__
+        n = self.controller.name
+
+        return "{}: '{}'".format(c, n)
+
+    def __getattr__(self, name):
+        return getattr(self.controller, name)
+
+    def get_device(self, name):
+        views = self.device_views
+
+        if name not in views:
+            device = self.controller.get_device(name)
+            views[name] = DEVICE_VIEWS.get(
+                type(device), DeviceView)(device, self)
+
+        return views[name]
+
+    def check_command(self, name):
+        return self.commands[name].active
+
+    def add_command_input(self, name, d):
+        steps = [Step.get_step_from_key(k) for k in d["steps"]]
+        devices = d["devices"]
+        window = d.get("window", 1)
+
+        self.commands[name] = Command(
+            name, steps, devices, window)
+
+    def update(self):
+        controller = self.controller
+        controller.update_for_frame()
+
+        for command in self.commands.values():
+            command.update(
+                controller.get_command_frame(*command.devices))
+
+
+class DeviceView:
+    """
+    A DeviceView passes attribute lookups through to a shared input device.
+    """
+    def __init__(self, device, view):
+        self.device = device
+        self.view = view
+
+    def __repr__(self):
+        return repr(self.device)
+
+    def __getattr__(self, name):
+        return getattr(self.device, name)
+
+
+class ButtonView(DeviceView):
+    def __init__(self, device, view):
+        super(ButtonView, self).__init__(device, view)
+        self._lifted = False
+
+    # True once the button has been released on or after the view's first frame
+    @property
+    def lifted(self):
+        if not self._lifted:
+            self._lifted = self.device.last_up >= self.view.start
+
+        return self._lifted
+
+    def check(self):
+        if self.lifted:
+            button = self.device
+
+            return button.held and not button.ignore
+
+
+class DpadView(DeviceView):
+    def check(self):
+        return self.view.get_device(
+            self.device.get_dominant().name).check()
+
+
+DEVICE_VIEWS = {
+    Button: ButtonView,
+    Dpad: DpadView
+}
@@ -1,7 +1,7 @@
 from classes import Clock, MessageLogger, Meter
-from controller import load_controller, make_controller
+from controller import ControllerRegistry
 from events import EventHandler
-from geometry import Rect, Wall
+from geometry import Rect, SpatialHash, Wall
 from graphics import Graphics, ImageGraphics, TextGraphics
 from resources import load_resource, load_style, DEFAULT_STYLE
 from zs_constants import SCREEN_SIZE, SOUND_EXT, SELECTED_COLOR, UNSELECTED_COLOR, DYING_TIME
@@ -203,11 +203,11 @@ class Entity:
 
     def set_controller(self, arg, clear=True):
         if type(arg) is str:
-            cont = load_controller(arg)
+            cont = ControllerRegistry.get_view(arg)
 
         else:
             name = arg.pop("name")
-            cont = make_controller(name, arg)
+            cont = ControllerRegistry.get_local_view(name, arg)
 
         if not clear:
             self.controllers.append(cont)
@@ -737,11 +737,25 @@ class ModelManager:
                 set_value(value)
 
 
+# overlaps smaller than this are treated as the sprite touching the wall
+PUSH_TOLERANCE = 1e-6
+
+
 class Region(Sprite):
+    """
+    A Region holds a set of walls that sprites collide with. The walls are
+    static, so their bounding boxes are put into a SpatialHash grid when
+    they're set, and each sprite is only tested against the walls near the
+    area its collision rect sweeps through this frame.
+    """
     def __init__(self, name):
         super(Region, self).__init__(name)
 
         self.walls = []
+        self.wall_grid = SpatialHash()
+        self.wall_order = {}
+        self.wall_bounds = None
+        self.continuous_collision = False
 
     def set_walls(self, *walls):
         for w in walls:
@@ -751,18 +765,56 @@ class Region(Sprite):
             wall = Wall(w["name"], w["origin"], w["end"])
             wall.log = self.log
 
+            bounds = wall.get_rect().get_bounds()
+            self.wall_order[id(wall)] = len(self.walls)
+            self.wall_grid.set_item(wall, bounds)
+            self.add_wall_bounds(bounds)
             self.walls.append(
                 wall
             )
 
+    def add_wall_bounds(self, bounds):
+        if not self.wall_bounds:
+            self.wall_bounds = bounds
+
+        else:
+            l1, t1, r1, b1 = self.wall_bounds
+            l2, t2, r2, b2 = bounds
+
+            self.wall_bounds = (
+                min(l1, l2), min(t1, t2), max(r1, r2), max(b1, b2))
+
+    # bounds of all the region's walls, used by the collision broadphase
+    def get_wall_bounds(self):
+        return self.wall_bounds or (0, 0, 0, 0)
+
+    # continuous collision sweeps each sprite's collision rect along its
+    # velocity so fast sprites can't pass through a wall between frames
+    def set_continuous_collision(self, value=True):
+        self.continuous_collision = value
+
     def set_group(self, group):
         group.add_item(self)
 
+    # returns the walls whose bounds overlap the collision rect swept along
+    # the velocity, in the order they were set
+    def get_nearby_walls(self, rect, velocity):
+        bounds = rect.get_swept_bounds(velocity.get_value())
+        walls = self.wall_grid.query(bounds)
+        walls.sort(key=lambda w: self.wall_order[id(w)])
+
+        return walls
+
     def test_sprite_collision(self, sprite):
+        if self.continuous_collision:
+            return self.test_swept_collision(sprite)
+
         collisions = []
         test = sprite.physics_interface.test_wall_collision
+        walls = self.get_nearby_walls(
+            sprite.get_collision_rect(), sprite.get_velocity())
 
-        for wall in self.walls:
+        for wall in walls:
             collision = test(wall, sprite)
 
             if collision:
@@ -770,11 +822,55 @@ class Region(Sprite):
 
         return collisions
 
-    @staticmethod
-    def handle_sprite_collision(sprite, collisions):
+    # walls the collision rect already overlaps give a contact with a time of
+    # impact of 0, and the rest are swept along the velocity
+    def test_swept_collision(self, sprite):
+        collisions = []
+        rect = sprite.get_collision_rect()
+        v = sprite.get_velocity()
+
+        for wall in self.get_nearby_walls(rect, v):
+            contact = (wall.get_penetration(rect, v) or
+                       wall.get_swept_collision(rect, v))
+
+            if contact:
+                collisions.append((wall, contact))
+
+        return collisions
+
+    def handle_sprite_collision(self, sprite, collisions):
         handle = sprite.physics_interface.smooth_wall_collision
 
-        for c in collisions:
-            wall, point = c
+        if self.continuous_collision:
+            self.handle_swept_collisions(sprite, collisions, handle)
+
+        else:
+            for c in collisions:
+                wall, point = c
+
+                handle(wall, sprite, point)
+
+    # swept contacts are resolved in order of time of impact, so the walls the
+    # sprite already overlaps are pushed out of first. Resolving one changes
+    # the sprite's movement, so the walls are tested again after each
+    # resolution until the sprite's movement is clear. A sprite stays touching
+    # a wall it's pushed out of, so a wall is only handled again if pushing
+    # out of another wall moved the sprite back into it
+    def handle_swept_collisions(self, sprite, collisions, handle):
+        pushed = set()
+
+        for i in range(2 * len(self.walls)):
+            collisions = [
+                c for c in collisions if c[1][0] or c[1][2] > PUSH_TOLERANCE or
+                id(c[0]) not in pushed]
+
+            if not collisions:
+                break
+
+            wall, contact = min(collisions, key=lambda c: c[1][0])
+            if not contact[0]:
+                pushed.add(id(wall))
+
+            handle(wall, sprite, None, contact=contact)
 
-            handle(wall, sprite, point)
+            collisions = self.test_swept_collision(sprite)
@@ -170,6 +170,23 @@ class Rect:
         except ValueError:
             return False
 
+    # returns the left, top, right and bottom edges as a tuple
+    def get_bounds(self):
+        x, y = self.position
+        w, h = self.size
+
+        return x, y, x + w, y + h
+
+    # bounds of the area the rect covers as it moves by (dx, dy)
+    def get_swept_bounds(self, movement):
+        dx, dy = movement
+        left, top, right, bottom = self.get_bounds()
+
+        return (
+            min(left, left + dx), min(top, top + dy),
+            max(right, right + dx), max(bottom, bottom + dy)
+        )
+
     def get_circle_collision(self, radius, position):
         points = [
             self.center,
@@ -186,6 +203,343 @@ class Rect:
                 return point
 
 
+class SpatialHash:
+    """
+    A SpatialHash object is a uniform grid broadphase. Items are stored in
+    each grid cell their bounding box overlaps, keyed by cell coordinates,
+    so only items that share a cell are ever paired and an item whose box
+    stays in the same cells between frames isn't rehashed.
+
+    Bounds are (left, top, right, bottom) tuples. Overlap is tested with a
+    margin of one pixel so the broadphase never rejects a pair that the
+    pixel truncated pygame rect test would report as touching.
+
+    Items are keyed by the order they were added in rather than by id, and
+    pairs are returned sorted by those keys, so the same items added in the
+    same order give the same pair order on every run.
+    """
+    CELL_SIZE = 64
+    MARGIN = 1
+
+    def __init__(self, cell_size=CELL_SIZE):
+        self.cell_size = cell_size
+        self.cells = {}
+        self.items = {}
+        self.keys = {}
+        self.next_key = 0
+
+    def __len__(self):
+        return len(self.items)
+
+    def clear(self):
+        self.cells = {}
+        self.items = {}
+        self.keys = {}
+        self.next_key = 0
+
+    # returns the item's key, giving it the next one if it's new
+    def get_key(self, item):
+        key = self.keys.get(id(item))
+
+        if key is None:
+            key = self.next_key
+            self.next_key += 1
+            self.keys[id(item)] = key
+
+        return key
+
+    # cells are picked from the bounds padded by the margin so that items
+    # within the margin of each other always share a cell
+    def get_cell_range(self, bounds):
+        size = self.cell_size
+        m = self.MARGIN
+        left, top, right, bottom = bounds
+
+        return (int((left - m) // size), int((top - m) // size),
+                int((right + m) // size), int((bottom + m) // size))
+
+    def add_to_cells(self, key, cell_range):
+        cells = self.cells
+        x1, y1, x2, y2 = cell_range
+
+        for x in range(x1, x2 + 1):
+            for y in range(y1, y2 + 1):
+                cell = x, y
+
+                if cell not in cells:
+                    cells[cell] = {}
+
+                cells[cell][key] = True
+
+    def remove_from_cells(self, key, cell_range):
+        cells = self.cells
+        x1, y1, x2, y2 = cell_range
+
+        for x in range(x1, x2 + 1):
+            for y in range(y1, y2 + 1):
+                cell = cells[(x, y)]
+                cell.pop(key)
+
+                if not cell:
+                    cells.pop((x, y))
+
+    # adds an item or updates its bounds. The item is only moved between
+    # cells if its cell range has changed
+    def set_item(self, item, bounds):
+        key = self.get_key(item)
+        cell_range = self.get_cell_range(bounds)
+        entry = self.items.get(key)
+
+        if entry:
+            old_range = entry[2]
+
+            if old_range != cell_range:
+                self.remove_from_cells(key, old_range)
+                self.add_to_cells(key, cell_range)
+
+        else:
+            self.add_to_cells(key, cell_range)
+
+        self.items[key] = item, bounds, cell_range
+
+    def remove_item(self, item):
+        key = self.keys.pop(id(item))
+        entry = self.items.pop(key)
+
+        self.remove_from_cells(key, entry[2])
+
+    # keeps the hash in sync with a list of (item, bounds) tuples, removing
+    # items that aren't in the list
+    def set_items(self, entries):
+        keys = {}
+
+        for item, bounds in entries:
+            keys[self.get_key(item)] = True
+            self.set_item(item, bounds)
+
+        for key in [k for k in self.items if k not in keys]:
+            self.remove_item(self.items[key][0])
+
+    @staticmethod
+    def check_overlap(b1, b2, margin=MARGIN):
+        l1, t1, r1, bt1 = b1
+        l2, t2, r2, bt2 = b2
+
+        return (l1 <= r2 + margin and l2 <= r1 + margin and
+                t1 <= bt2 + margin and t2 <= bt1 + margin)
+
+    # returns each pair of items with overlapping bounds once, in key order
+    def get_pairs(self):
+        items = self.items
+        check = self.check_overlap
+        found = {}
+
+        for cell in self.cells.values():
+            if len(cell) < 2:
+                continue
+
+            keys = list(cell)
+
+            for i in range(len(keys) - 1):
+                k1 = keys[i]
+
+                for k2 in keys[i + 1:]:
+                    pair = (k1, k2) if k1 < k2 else (k2, k1)
+
+                    if pair not in found:
+                        found[pair] = check(items[k1][1], items[k2][1])
+
+        return [(items[k1][0], items[k2][0]) for k1, k2 in sorted(found)
+                if found[(k1, k2)]]
+
+    # returns the items whose bounds overlap the bounds passed
+    def query(self, bounds):
+        items = self.items
+        check = self.check_overlap
+        x1, y1, x2, y2 = self.get_cell_range(bounds)
+        found = {}
+
+        for x in range(x1, x2 + 1):
+            for y in range(y1, y2 + 1):
+                for key in self.cells.get((x, y), ()):
+                    if key not in found:
+                        found[key] = check(bounds, items[key][1])
+
+        return [items[k][0] for k in sorted(found) if found[k]]
+
+
+class SweepAndPrune:
+    """
+    A SweepAndPrune object is a sort and sweep broadphase. The left and right
+    edges of every item's bounding box are kept in one list sorted along the
+    x axis. Sprites only move a little each frame, so the list from the last
+    frame is nearly sorted and insertion sort repairs it in close to linear
+    time. A sweep over the list then pairs each item with the items whose x
+    span is open when it starts, and checks the y axis.
+
+    Items can be set as one group, pairing every item with every other, or
+    as two groups, pairing only items from different groups. After each call
+    to get_pairs the 'removed' list holds the pairs that stopped overlapping
+    since the last call, which a ContactCache uses to drop their contacts.
+
+    Like the SpatialHash, items are keyed by the order they were added in and
+    pairs come out sorted by those keys, so their order is the same on every
+    run.
+    """
+    MARGIN = 1
+
+    def __init__(self):
+        self.items = {}
+        self.endpoints = []
+        self.pairs = {}
+
+        self.two_groups = False
+        self.removed = []
+
+        self.keys = {}
+        self.next_key = 0
+
+    def __len__(self):
+        return len(self.items)
+
+    def clear(self):
+        self.items = {}
+        self.endpoints = []
+        self.pairs = {}
+        self.removed = []
+        self.keys = {}
+        self.next_key = 0
+
+    # returns the item's key, giving it the next one if it's new
+    def get_key(self, item):
+        key = self.keys.get(id(item))
+
+        if key is None:
+            key = self.next_key
+            self.next_key += 1
+            self.keys[id(item)] = key
+
+        return key
+
+    # keeps the endpoint list in sync with one or two lists of (item, bounds)
+    # tuples, removing items that aren't in either list
+    def set_items(self, entries, entries_b=None):
+        items = self.items
+        endpoints = self.endpoints
+        self.two_groups = entries_b is not None
+        keys = {}
+
+        groups = [entries]
+        if self.two_groups:
+            groups.append(entries_b)
+
+        for group, group_entries in enumerate(groups):
+            for item, bounds in group_entries:
+                key = self.get_key(item)
+                keys[key] = True
+                entry = items.get(key)
+
+                if entry:
+                    entry[0] = item
+                    entry[1] = bounds
+                    entry[2] = group
+
+                else:
+                    items[key] = [item, bounds, group]
+                    endpoints.append([0, 0, key])
+                    endpoints.append([0, 1, key])
+
+        if len(keys) < len(items):
+            for key in [k for k in items if k not in keys]:
+                self.keys.pop(id(items.pop(key)[0]))
+
+            self.endpoints = [e for e in endpoints if e[2] in keys]
+
+        self.update_endpoints()
+
+    def update_endpoints(self):
+        items = self.items
+        m = self.MARGIN
+
+        for e in self.endpoints:
+            bounds = items[e[2]][1]
+
+            if e[1]:
+                e[0] = bounds[2] + m
+            else:
+                e[0] = bounds[0]
+
+        self.sort_endpoints()
+
+    # insertion sort by x, with left edges before right edges at the same x
+    # so that touching boxes are paired
+    def sort_endpoints(self):
+        endpoints = self.endpoints
+
+        for i in range(1, len(endpoints)):
+            e = endpoints[i]
+            x, edge = e[0], e[1]
+            j = i - 1
+
+            while j >= 0:
+                o = endpoints[j]
+
+                if o[0] < x or (o[0] == x and o[1] <= edge):
+                    break
+
+                endpoints[j + 1] = o
+                j -= 1
+
+            endpoints[j + 1] = e
+
+    # returns each pair of items with overlapping bounds once, in key order.
+    # For two groups each pair is ordered (group a item, group b item)
+    def get_pairs(self):
+        items = self.items
+        two_groups = self.two_groups
+        m = self.MARGIN
+        active = {}
+        pairs = {}
+
+        for x, edge, key in self.endpoints:
+            if edge:
+                active.pop(key)
+                continue
+
+            item, bounds, group = items[key]
+            top, bottom = bounds[1], bounds[3]
+
+            for other in active:
+                o_item, o_bounds, o_group = items[other]
+
+                if two_groups and group == o_group:
+                    continue
+
+                if top <= o_bounds[3] + m and o_bounds[1] <= bottom + m:
+                    if two_groups:
+                        if group:
+                            pair = (other, key), (o_item, item)
+                        else:
+                            pair = (key, other), (item, o_item)
+
+                    elif key < other:
+                        pair = (key, other), (item, o_item)
+
+                    else:
+                        pair = (other, key), (o_item, item)
+
+                    pairs[pair[0]] = pair[1]
+
+            active[key] = True
+
+        pairs = {k: pairs[k] for k in sorted(pairs)}
+        last = self.pairs
+        self.removed = [last[k] for k in last if k not in pairs]
+        self.pairs = pairs
+
+        return list(pairs.values())
+
+
 class Vector:
     def __init__(self, name, i_hat, j_hat):
         self.name = name
@@ -529,6 +883,110 @@ class Wall(Vector):
         else:
             return False
 
+    # Sweeps an axis aligned Rect along a displacement vector and returns
+    # a (time of impact, contact normal, 0) contact tuple, or False if the
+    # rect doesn't touch the wall while moving into it. The time of impact
+    # is a fraction of the displacement (0 to 1] and the normal is a unit
+    # Vector pointing away from the wall, toward the rect. A rect that
+    # already overlaps the wall isn't swept, see get_penetration.
+    # This is a separating axis test on the x axis, the y axis and the wall's
+    # normal, so it only does arithmetic on the rect and the wall's end points.
+    def get_swept_collision(self, rect, velocity):
+        vx, vy = velocity.get_value()
+        if not (vx or vy):
+            return False
+
+        i, j = self.get_value()
+        length = sqrt(i**2 + j**2)
+        if not length:
+            return False
+
+        ox, oy = self.origin
+        fx, fy = ox + i, oy + j
+        cx, cy = rect.center
+        hw, hh = rect.width / 2, rect.height / 2
+
+        axes = (1, 0), (0, 1), (-j / length, i / length)
+        entry, exit_time = float("-inf"), float("inf")
+        normal = None
+
+        for ax, ay in axes:
+            b = (cx * ax) + (cy * ay)
+            r = (hw * abs(ax)) + (hh * abs(ay))
+            s0 = (ox * ax) + (oy * ay)
+            s1 = (fx * ax) + (fy * ay)
+            s_min, s_max = min(s0, s1), max(s0, s1)
+            v = (vx * ax) + (vy * ay)
+
+            if v == 0:
+                if b + r < s_min or b - r > s_max:
+                    return False
+
+                continue
+
+            t1 = (s_min - r - b) / v
+            t2 = (s_max + r - b) / v
+            if t1 > t2:
+                t1, t2 = t2, t1
+
+            if t1 > entry:
+                entry = t1
+                if v > 0:
+                    normal = -ax, -ay
+                else:
+                    normal = ax, ay
+
+            if t2 < exit_time:
+                exit_time = t2
+
+            if entry > exit_time:
+                return False
+
+        if normal is None or entry <= 0 or entry > 1:
+            return False
+
+        nx, ny = normal
+        if (vx * nx) + (vy * ny) >= 0:
+            return False
+
+        return entry, Vector(self.name + " contact normal", nx, ny), 0
+
+    # Returns a (0, contact normal, depth) contact tuple if an axis aligned
+    # Rect overlaps the wall before it moves by a displacement vector, or
+    # False if it doesn't. The normal is the wall's normal on the side the
+    # rect's center is on, so it doesn't depend on which way the rect is
+    # moving, and the depth is how far the moved rect has to be pushed along
+    # it to stop overlapping the wall (0 if it's moving clear).
+    def get_penetration(self, rect, velocity):
+        i, j = self.get_value()
+        length = sqrt(i**2 + j**2)
+        if not length:
+            return False
+
+        ox, oy = self.origin
+        fx, fy = ox + i, oy + j
+        cx, cy = rect.center
+        hw, hh = rect.width / 2, rect.height / 2
+
+        if (cx + hw < min(ox, fx) or cx - hw > max(ox, fx) or
+                cy + hh < min(oy, fy) or cy - hh > max(oy, fy)):
+            return False
+
+        nx, ny = j / length, -i / length
+        reach = (hw * abs(nx)) + (hh * abs(ny))
+        d = ((cx - ox) * nx) + ((cy - oy) * ny)
+
+        if d < 0:
+            nx, ny, d = -nx, -ny, -d
+
+        if d > reach:
+            return False
+
+        vx, vy = velocity.get_value()
+        depth = max(reach - (d + (vx * nx) + (vy * ny)), 0)
+
+        return 0, Vector(self.name + " contact normal", nx, ny), depth
+
     def get_normal_adjustment(self, point):
         x, y = point
         normal = self.get_normal()
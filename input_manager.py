@@ -1,5 +1,7 @@
 import pygame
 
+from zs_constants import INPUT_EVENTS
+
 
 '''
 The following "Mapping" classes are basically just wrapper objects for interfacing
@@ -9,6 +11,252 @@ for returning a data argument for the Controller / Device objects 'get_value' me
 
 pygame.init()
 
+JOY_EVENTS = (
+    pygame.JOYBUTTONDOWN, pygame.JOYBUTTONUP,
+    pygame.JOYAXISMOTION, pygame.JOYHATMOTION
+)
+
+
+class JoystickState:
+    """
+    A JoystickState holds the button, axis and hat values of one joystick,
+    read all at once for a given frame of the InputSnapshot.
+    """
+    def __init__(self, joy_device, frame):
+        self.frame = frame
+
+        self.buttons = tuple(
+            joy_device.get_button(i)
+            for i in range(joy_device.get_numbuttons())
+        )
+        self.axes = tuple(
+            joy_device.get_axis(i)
+            for i in range(joy_device.get_numaxes())
+        )
+        self.hats = tuple(
+            joy_device.get_hat(i)
+            for i in range(joy_device.get_numhats())
+        )
+
+
+class KeyState:
+    """
+    A KeyState is the event driven stand in for pygame.key.get_pressed(). It's kept up to
+    date from KEYDOWN and KEYUP events, and a key that's pressed and released within one
+    frame is latched, so it still reads as pressed for that frame.
+    """
+    def __init__(self):
+        self.held = set()
+        self.down = set()
+        self.latched = set()
+
+    def __getitem__(self, key):
+        return key in self.held or key in self.latched
+
+    # returns True if any key state changed
+    def handle_events(self, events):
+        changed = bool(self.latched)
+        self.latched = set()
+        self.down = set()
+
+        for event in events:
+            if event.type == pygame.KEYDOWN:
+                self.held.add(event.key)
+                self.down.add(event.key)
+                changed = True
+
+            elif event.type == pygame.KEYUP:
+                if event.key in self.down:
+                    self.latched.add(event.key)
+
+                self.held.discard(event.key)
+                changed = True
+
+        return changed
+
+    # drops held keys that were released while the events were read
+    # somewhere else, like a modal loop
+    def resync(self, pressed):
+        self.held = {key for key in self.held if pressed[key]}
+        self.down = set()
+        self.latched = set()
+
+
+class EventJoystickState:
+    """
+    An EventJoystickState has the same buttons, axes and hats as a JoystickState, read once
+    from the joystick and then kept up to date from its JOY* events, with buttons latched
+    the same way as a KeyState's keys.
+    """
+    def __init__(self, joy_device):
+        state = JoystickState(joy_device, 0)
+
+        self.held = list(state.buttons)
+        self.axes = list(state.axes)
+        self.hats = list(state.hats)
+        self.down = set()
+        self.latched = set()
+        self.buttons = tuple(self.held)
+
+    def handle_event(self, event):
+        if event.type == pygame.JOYBUTTONDOWN:
+            self.held[event.button] = 1
+            self.down.add(event.button)
+
+        elif event.type == pygame.JOYBUTTONUP:
+            if event.button in self.down:
+                self.latched.add(event.button)
+
+            self.held[event.button] = 0
+
+        elif event.type == pygame.JOYAXISMOTION:
+            self.axes[event.axis] = event.value
+
+        elif event.type == pygame.JOYHATMOTION:
+            self.hats[event.hat] = event.value
+
+    # lets go of everything, for a joystick that's been unplugged
+    def release(self):
+        self.held = [0] * len(self.held)
+        self.axes = [0] * len(self.axes)
+        self.hats = [(0, 0)] * len(self.hats)
+        self.down = set()
+        self.latched = set()
+        self.buttons = tuple(self.held)
+
+    def start_frame(self):
+        changed = bool(self.latched)
+        self.down = set()
+        self.latched = set()
+
+        return changed
+
+    def end_frame(self):
+        buttons = list(self.held)
+
+        for i in self.latched:
+            buttons[i] = 1
+
+        self.buttons = tuple(buttons)
+
+
+class InputSnapshot:
+    """
+    The InputSnapshot samples the keyboard once per frame, so every mapping
+    of every controller reads the same key state instead of polling Pygame
+    on its own. The game loop calls 'sample' after pumping the event queue,
+    which also starts a new frame. Each joystick is only read the first
+    time a mapping asks for it during a frame.
+
+    With INPUT_EVENTS set in zs_constants, 'sample' is passed the frame's
+    events instead, and the key and joystick states are kept up to date from
+    them, so presses shorter than a frame aren't lost. 'version' only goes
+    up on frames where the input changed, so controllers can skip reading
+    their mappings on idle frames. Joysticks are kept by instance id, and
+    JOYDEVICEADDED and JOYDEVICEREMOVED events add and remove them. Code
+    that reads the event queue itself, like InputManager.get_mapping, calls
+    'resync' afterwards so keys released meanwhile don't stay held.
+    """
+    frame = 0
+    version = 0
+    keys = None
+    joysticks = {}
+    use_events = INPUT_EVENTS
+
+    @staticmethod
+    def sample(events=None):
+        # PYGAME CHOKE POINT
+
+        InputSnapshot.frame += 1
+
+        if InputSnapshot.use_events and events is not None:
+            if InputSnapshot.handle_events(events):
+                InputSnapshot.version += 1
+
+        else:
+            InputSnapshot.keys = pygame.key.get_pressed()
+            InputSnapshot.version += 1
+
+    @staticmethod
+    def handle_events(events):
+        keys = InputSnapshot.keys
+
+        if not isinstance(keys, KeyState):
+            keys = KeyState()
+            InputSnapshot.keys = keys
+            InputSnapshot.joysticks = {}
+
+        changed = keys.handle_events(events)
+        joysticks = InputSnapshot.joysticks
+
+        for state in joysticks.values():
+            changed = state.start_frame() or changed
+
+        for event in events:
+            if event.type == pygame.JOYDEVICEREMOVED:
+                if event.instance_id in joysticks:
+                    joysticks[event.instance_id].release()
+
+                changed = InputManager.handle_device_event(event) or changed
+
+            elif event.type == pygame.JOYDEVICEADDED:
+                InputManager.handle_device_event(event)
+
+            elif event.type in JOY_EVENTS:
+                joy_id = event.instance_id
+                joy_device = InputManager.get_device(joy_id)
+
+                if joy_device is None:
+                    continue
+
+                if joy_id not in joysticks:
+                    joysticks[joy_id] = EventJoystickState(joy_device)
+
+                joysticks[joy_id].handle_event(event)
+                changed = True
+
+        for state in joysticks.values():
+            state.end_frame()
+
+        return changed
+
+    # called after the event queue has been read outside of 'sample'. Held
+    # keys are checked against the keyboard, and joysticks are read again
+    @staticmethod
+    def resync():
+        keys = InputSnapshot.keys
+
+        if isinstance(keys, KeyState):
+            keys.resync(pygame.key.get_pressed())
+            InputSnapshot.joysticks = {}
+            InputSnapshot.version += 1
+
+    @staticmethod
+    def get_keys():
+        if InputSnapshot.keys is None:
+            InputSnapshot.sample()
+
+        return InputSnapshot.keys
+
+    @staticmethod
+    def get_joystick(joy_device):
+        joy_id = joy_device.get_instance_id()
+        frame = InputSnapshot.frame
+        state = InputSnapshot.joysticks.get(joy_id)
+
+        if isinstance(InputSnapshot.keys, KeyState):
+            if not state:
+                state = EventJoystickState(joy_device)
+                InputSnapshot.joysticks[joy_id] = state
+
+            return state
+
+        if not state or state.frame != frame:
+            state = JoystickState(joy_device, frame)
+            InputSnapshot.joysticks[joy_id] = state
+
+        return state
+
 
 class ButtonMappingKey:
     def __init__(self, id_num):
@@ -24,7 +272,7 @@ class ButtonMappingKey:
         return ["button_map_key", self.get_key_name()]
 
     def is_pressed(self):
-        return pygame.key.get_pressed()[self.id_num]
+        return InputSnapshot.get_keys()[self.id_num]
 
     def get_key_name(self):
         return pygame.key.name(self.id_num)
@@ -42,17 +290,20 @@ class ButtonMappingKey:
 class ButtonMappingButton(ButtonMappingKey):
     def __init__(self, id_num, joy_device_name, joy_id):
         super(ButtonMappingButton, self).__init__(id_num)
+        self.joy_id = joy_id
         self.joy_device = InputManager.INPUT_DEVICES[joy_id]
 
+        assert self.joy_device is not None
         assert self.joy_device.get_name() == joy_device_name
 
     def get_args(self):
         return ["button_map_button", self.id_num,
                 self.joy_device.get_name(),
-                self.joy_device.get_id()]
+                self.joy_id]
 
     def is_pressed(self):
-        return self.joy_device.get_button(self.id_num)
+        return InputSnapshot.get_joystick(
+            self.joy_device).buttons[self.id_num]
 
 
 class ButtonMappingAxis(ButtonMappingButton):
@@ -67,11 +318,12 @@ class ButtonMappingAxis(ButtonMappingButton):
     def get_args(self):
         return ["button_map_axis", self.id_num,
                 self.joy_device.get_name(),
-                self.joy_device.get_id(),
+                self.joy_id,
                 self.sign]
 
     def is_pressed(self):
-        axis = self.joy_device.get_axis(self.id_num)
+        axis = InputSnapshot.get_joystick(
+            self.joy_device).axes[self.id_num]
 
         return axis * self.sign > self.dead_zone
 
@@ -85,12 +337,13 @@ class ButtonMappingHat(ButtonMappingButton):
     def get_args(self):
         return ["button_map_hat", self.id_num,
                 self.joy_device.get_name(),
-                self.joy_device.get_id(),
+                self.joy_id,
                 self.position,
                 self.axis]
 
     def is_pressed(self):
-        hat = self.joy_device.get_hat(self.id_num)
+        hat = InputSnapshot.get_joystick(
+            self.joy_device).hats[self.id_num]
         if self.axis != -1:
             return hat[self.axis] == self.position
         else:
@@ -101,26 +354,32 @@ class AxisMapping:
     def __init__(self, id_num, joy_device_name, joy_id, sign):
         self.id_num = id_num
         self.sign = sign
+        self.joy_id = joy_id
         self.joy_device = InputManager.INPUT_DEVICES[joy_id]
 
+        assert self.joy_device is not None
         assert self.joy_device.get_name() == joy_device_name
 
     def get_args(self):
         return ["axis_mapping", self.id_num,
                 self.joy_device.get_name(),
-                self.joy_device.get_id(),
+                self.joy_id,
                 self.sign]
 
     def get_value(self):
         sign = self.sign
 
-        return self.joy_device.get_axis(self.id_num) * sign
+        return InputSnapshot.get_joystick(
+            self.joy_device).axes[self.id_num] * sign
 
 
 class InputManager:
     STICK_DEAD_ZONE = .1
     AXIS_NEUTRAL = False
     AXIS_MIN = .9
+    # joysticks by the position they were connected in, which mappings use
+    # as their joy_id. An unplugged joystick leaves None in its place, so
+    # the positions of the others don't change
     INPUT_DEVICES = []
 
     for J in range(pygame.joystick.get_count()):
@@ -128,20 +387,71 @@ class InputManager:
         joy.init()
         INPUT_DEVICES.append(joy)
 
+    # returns the joystick with a given instance id, or None if it's been
+    # unplugged
+    @staticmethod
+    def get_device(instance_id):
+        for device in InputManager.INPUT_DEVICES:
+            if device and device.get_instance_id() == instance_id:
+                return device
+
+    # returns the position in INPUT_DEVICES of the joystick with a given
+    # instance id
+    @staticmethod
+    def get_device_index(instance_id):
+        return InputManager.INPUT_DEVICES.index(
+            InputManager.get_device(instance_id))
+
+    # adds or removes a joystick for a JOYDEVICEADDED or JOYDEVICEREMOVED
+    # event, returning True if INPUT_DEVICES changed. Pygame also posts
+    # JOYDEVICEADDED for the joysticks connected at start up
+    @staticmethod
+    def handle_device_event(event):
+        devices = InputManager.INPUT_DEVICES
+
+        if event.type == pygame.JOYDEVICEADDED:
+            joy = pygame.joystick.Joystick(event.device_index)
+
+            if InputManager.get_device(joy.get_instance_id()) is None:
+                joy.init()
+                devices.append(joy)
+
+                return True
+
+        if event.type == pygame.JOYDEVICEREMOVED:
+            joy = InputManager.get_device(event.instance_id)
+
+            if joy is not None:
+                devices[devices.index(joy)] = None
+
+                return True
+
+        return False
+
     @staticmethod
     def check_axes():
         axes = []
         for device in InputManager.INPUT_DEVICES:
+            if not device:
+                continue
+
             for i in range(device.get_numaxes()):
                 axes.append(device.get_axis(i))
 
         if not InputManager.AXIS_NEUTRAL:
             InputManager.AXIS_NEUTRAL = all([axis < .01 for axis in axes])
 
+    # waits for a key or joystick input and returns a mapping for it. This
+    # reads the event queue itself, so the InputSnapshot is resynced after
     @staticmethod
     def get_mapping():
-        devices = InputManager.INPUT_DEVICES
+        mapping = InputManager.wait_for_mapping()
+        InputSnapshot.resync()
+
+        return mapping
 
+    @staticmethod
+    def wait_for_mapping():
         pygame.event.clear()
         while True:
             InputManager.check_axes()
@@ -150,6 +460,10 @@ class InputManager:
                 if event.type == pygame.QUIT:
                     exit()
 
+                if event.type in (pygame.JOYDEVICEADDED,
+                                  pygame.JOYDEVICEREMOVED):
+                    InputManager.handle_device_event(event)
+
                 axis, button, hat, key = (
                     event.type == pygame.JOYAXISMOTION,
                     event.type == pygame.JOYBUTTONDOWN,
@@ -159,8 +473,13 @@ class InputManager:
                 if key:
                     return ButtonMappingKey(event.key)
 
-                if hasattr(event, "joy"):
-                    input_device = devices[event.joy]
+                if event.type in JOY_EVENTS:
+                    input_device = InputManager.get_device(event.instance_id)
+
+                    if input_device is None:
+                        continue
+
+                    joy_id = InputManager.get_device_index(event.instance_id)
 
                     if axis and abs(event.value) > InputManager.AXIS_MIN:
                         positive = event.value > 0
@@ -170,13 +489,13 @@ class InputManager:
                             InputManager.AXIS_NEUTRAL = False
                             return ButtonMappingAxis(
                                 event.axis, input_device.get_name(),
-                                input_device.get_id(), sign)
+                                joy_id, sign)
 
                     if button:
                         return ButtonMappingButton(
                             event.button,
                             input_device.get_name(),
-                            input_device.get_id())
+                            joy_id)
 
                     if hat:
                         x, y = event.value
@@ -194,11 +513,11 @@ class InputManager:
 
                         return ButtonMappingHat(
                             event.hat, input_device.get_name(),
-                            input_device.get_id(), value, axis)
+                            joy_id, value, axis)
 
     @staticmethod
     def get_axis():
-        devices = InputManager.INPUT_DEVICES
+        devices = [d for d in InputManager.INPUT_DEVICES if d]
         if len(devices) == 0:
             raise IOError("No input devices connected")
         sticks = [device.get_numaxes() > 0 for device in devices]
@@ -217,9 +536,16 @@ class InputManager:
                     else:
                         sign = -1
                     id_num = event.axis
-                    input_device = InputManager.INPUT_DEVICES[event.joy]
+                    input_device = InputManager.get_device(event.instance_id)
+
+                    if input_device is None:
+                        continue
 
                     if InputManager.AXIS_NEUTRAL:
                         InputManager.AXIS_NEUTRAL = False
+                        InputSnapshot.resync()
+
                         return AxisMapping(
-                            id_num, input_device, sign)
+                            id_num, input_device.get_name(),
+                            InputManager.get_device_index(event.instance_id),
+                            sign)
@@ -0,0 +1,238 @@
+from controller import Dpad, DirectionCache
+
+'''
+The InputRecorder writes the frame data of every controller to a binary file as the game runs,
+and the InputReplay reads it back so each controller's update_frames takes its values from the
+file instead of its mappings. The file starts with MAGIC and a version byte, followed by
+records that each start with a tag byte:
+
+    CONTROLLER  index, name, and one kind byte per device (KIND_DPAD or KIND_BUTTON)
+    RUN         index, run length, and one signed byte per device
+
+A RUN record stands for 'run length' frames in a row with the same values, so held buttons and
+idle stretches take a few bytes. Dpad values are stored as DirectionCache codes, and numbers
+are unsigned LEB128 varints.
+'''
+
+MAGIC = b"ZSIR"
+VERSION = 1
+
+CONTROLLER = 1
+RUN = 2
+
+KIND_BUTTON = 0
+KIND_DPAD = 1
+
+
+def write_varint(file, value):
+    out = bytearray()
+
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            break
+
+    file.write(out)
+
+
+def read_varint(data, i):
+    value = 0
+    shift = 0
+
+    while True:
+        byte = data[i]
+        i += 1
+        value |= (byte & 0x7F) << shift
+        shift += 7
+
+        if not byte & 0x80:
+            return value, i
+
+
+def get_kinds(controller):
+    return bytes(
+        KIND_DPAD if type(d) is Dpad else KIND_BUTTON
+        for d in controller.devices
+    )
+
+
+def encode_values(kinds, values):
+    out = bytearray()
+
+    for kind, value in zip(kinds, values):
+        if kind == KIND_DPAD:
+            x, y = value
+            value = (x + 1) * 3 + (y + 1)
+
+        out.append(value & 0xFF)
+
+    return bytes(out)
+
+
+def decode_values(kinds, data):
+    values = []
+
+    for kind, byte in zip(kinds, data):
+        if byte > 127:
+            byte -= 256
+
+        if kind == KIND_DPAD:
+            values.append(DirectionCache.DIRECTIONS[byte])
+        else:
+            values.append(byte)
+
+    return values
+
+
+class InputRecorder:
+    """
+    An InputRecorder streams controller frame data to a file. Each controller's values are
+    held back until they change, and then written as one RUN record for the whole run.
+    'close' writes the last run of each controller.
+    """
+    def __init__(self, file_name):
+        self.file = open(file_name, "wb")
+        self.file.write(MAGIC + bytes([VERSION]))
+
+        # controller name: [index, kinds, last encoded values, run length]
+        self.controllers = {}
+
+    def record(self, controller, values):
+        entry = self.controllers.get(controller.name)
+
+        if not entry:
+            entry = self.add_controller(controller)
+
+        data = encode_values(entry[1], values)
+
+        if data == entry[2]:
+            entry[3] += 1
+
+        else:
+            self.write_run(entry)
+            entry[2] = data
+            entry[3] = 1
+
+    def add_controller(self, controller):
+        name = controller.name.encode()
+        kinds = get_kinds(controller)
+        index = len(self.controllers)
+
+        file = self.file
+        file.write(bytes([CONTROLLER]))
+        write_varint(file, index)
+        write_varint(file, len(name))
+        file.write(name)
+        write_varint(file, len(kinds))
+        file.write(kinds)
+
+        entry = [index, kinds, None, 0]
+        self.controllers[controller.name] = entry
+
+        return entry
+
+    def write_run(self, entry):
+        index, kinds, data, run = entry
+
+        if run:
+            file = self.file
+            file.write(bytes([RUN]))
+            write_varint(file, index)
+            write_varint(file, run)
+            file.write(data)
+
+    def close(self):
+        if self.file:
+            for entry in self.controllers.values():
+                self.write_run(entry)
+
+            self.file.close()
+            self.file = None
+
+
+class InputReplay:
+    """
+    An InputReplay loads a recorded input file and hands each controller its recorded values,
+    one frame per call to 'get_values'. Once any controller has used up its frames the replay
+    is 'finished', and that controller gets its devices' default values from then on.
+    """
+    def __init__(self, file_name):
+        with open(file_name, "rb") as file:
+            data = file.read()
+
+        if data[:4] != MAGIC or data[4] != VERSION:
+            raise IOError("{} isn't an input recording".format(file_name))
+
+        # controller name: [kinds, runs as [values, run length], run index, frames used]
+        self.controllers = {}
+        self.finished = False
+        self.load_records(data, 5)
+
+    def load_records(self, data, i):
+        names = {}
+
+        while i < len(data):
+            tag = data[i]
+            index, i = read_varint(data, i + 1)
+
+            if tag == CONTROLLER:
+                length, i = read_varint(data, i)
+                name = data[i:i + length].decode()
+                i += length
+
+                length, i = read_varint(data, i)
+                kinds = data[i:i + length]
+                i += length
+
+                names[index] = name
+                self.controllers[name] = [kinds, [], 0, 0]
+
+            elif tag == RUN:
+                entry = self.controllers[names[index]]
+                run, i = read_varint(data, i)
+                length = len(entry[0])
+
+                values = decode_values(entry[0], data[i:i + length])
+                i += length
+                entry[1].append([values, run])
+
+            else:
+                raise IOError("bad record tag {} in input recording".format(tag))
+
+    def get_values(self, controller):
+        entry = self.controllers.get(controller.name)
+
+        if not entry:
+            raise IOError("no recorded input for {}".format(controller.name))
+
+        kinds, runs, r, used = entry
+
+        if not r and not used and kinds != get_kinds(controller):
+            raise IOError("recorded devices don't match {}".format(controller.name))
+
+        if r == len(runs):
+            self.finished = True
+
+            return [d.default for d in controller.devices]
+
+        values, run = runs[r]
+        used += 1
+
+        if used == run:
+            entry[2] = r + 1
+            used = 0
+
+        entry[3] = used
+
+        return values
+
+    def get_frame_count(self):
+        return max(
+            sum(run for values, run in entry[1])
+            for entry in self.controllers.values()
+        )
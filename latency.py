@@ -0,0 +1,148 @@
+from collections import Counter
+from time import perf_counter
+
+'''
+The LatencyMonitor measures how long it takes for a change in a controller's input to show up
+on screen. Hooks in Controller.update_frames, StateMachine.set_state, the physics updates and
+the game loop's display.flip report to LatencyMonitor.ACTIVE when one is set, and do nothing
+otherwise. Only moves made under a force from a controller that changed since the last frame
+count as responses, so momentum, held directions and collision pushes don't.
+'''
+
+# frames an input is waited on for a response before it's counted as having none
+MAX_WAIT = 60
+MS_BUCKET = 4
+KINDS = ("state", "move")
+
+
+class LatencyMonitor:
+    """
+    A LatencyMonitor timestamps each frame a controller's values change, and waits for the
+    first state change and the first input driven move made by an entity holding that
+    controller, until the controller's values change again or MAX_WAIT frames pass. At the
+    display.flip after each of those responses, the time and number of frames since the input
+    are added to that kind of response's histograms. 'report' returns the histograms as text.
+    """
+    ACTIVE = None
+
+    def __init__(self):
+        self.frame = 0
+        self.last_values = {}
+
+        # [controller name, frame, time, {response kind: time}, response kinds shown]
+        self.pending = []
+        self.unanswered = 0
+
+        self.frame_histograms = {}
+        self.ms_histograms = {}
+        self.response_ms = {}
+
+    # called with each controller's values as they're sampled
+    def on_input(self, controller, values):
+        name = controller.name
+        last = self.last_values.get(name)
+        self.last_values[name] = values
+
+        if last is not None and last != values:
+            # a response after this input can't be told apart from one to an earlier
+            # input that's still waiting, so the earlier one stops waiting
+            pending = []
+
+            for entry in self.pending:
+                if entry[0] != name:
+                    pending.append(entry)
+
+                elif not entry[3]:
+                    self.unanswered += 1
+
+            pending.append([name, self.frame, perf_counter(), {}, set()])
+            self.pending = pending
+
+    def on_response(self, kind, entity):
+        if not self.pending or not entity.controllers:
+            return
+
+        names = [c.name for c in entity.controllers]
+        t = perf_counter()
+
+        for name, frame, start, responses, shown in self.pending:
+            if name in names and kind not in responses:
+                responses[kind] = t
+
+    def on_state_change(self, machine):
+        entity = getattr(machine, "entity", None)
+
+        if entity:
+            self.on_response("state", entity)
+
+    def on_move(self, entity):
+        self.on_response("move", entity)
+
+    # called after each display.flip
+    def on_flip(self):
+        t = perf_counter()
+        frame = self.frame
+        pending = []
+
+        for entry in self.pending:
+            name, start_frame, start, responses, shown = entry
+
+            for kind in responses:
+                if kind not in shown:
+                    shown.add(kind)
+                    self.add_sample(
+                        kind, frame - start_frame, t - start,
+                        responses[kind] - start)
+
+            if len(shown) < len(KINDS) and frame - start_frame < MAX_WAIT:
+                pending.append(entry)
+
+            elif not shown:
+                self.unanswered += 1
+
+        self.pending = pending
+        self.frame += 1
+
+    def add_sample(self, kind, frames, seconds, response_seconds):
+        ms = seconds * 1000
+        bucket = int(ms // MS_BUCKET) * MS_BUCKET
+
+        self.frame_histograms.setdefault(kind, Counter())[frames] += 1
+        self.ms_histograms.setdefault(kind, Counter())[bucket] += 1
+        self.response_ms.setdefault(kind, []).append(response_seconds * 1000)
+
+    @staticmethod
+    def format_histogram(counter, label):
+        total = sum(counter.values())
+        lines = []
+
+        for key in sorted(counter):
+            n = counter[key]
+            bar = "#" * max(1, round(40 * n / total))
+            lines.append("  {:>10} {:>6}  {}".format(label(key), n, bar))
+
+        return lines
+
+    def report(self):
+        lines = ["input latency over {} frames".format(self.frame)]
+
+        for kind in sorted(self.frame_histograms):
+            response = sorted(self.response_ms[kind])
+            median = response[len(response) // 2]
+
+            lines.append("")
+            lines.append("{}: {} inputs, median {:.2f}ms from input to response".format(
+                kind, len(response), median))
+            lines.append(" frames from input to the flip that shows it")
+            lines += self.format_histogram(
+                self.frame_histograms[kind], lambda k: "{} frames".format(k))
+            lines.append(" ms from input to the flip that shows it")
+            lines += self.format_histogram(
+                self.ms_histograms[kind],
+                lambda k: "{}-{}ms".format(k, k + MS_BUCKET))
+
+        lines.append("")
+        lines.append("{} inputs had no response before the next input or within {} frames".format(
+            self.unanswered, MAX_WAIT))
+
+        return "\n".join(lines)
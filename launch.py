@@ -1,8 +1,15 @@
+import atexit
+from argparse import ArgumentParser
 from sys import exit
+from time import perf_counter
 
 import pygame
 
+from controller import Controller
 from environment import Environment
+from input_manager import InputSnapshot
+from input_recorder import InputRecorder, InputReplay
+from latency import LatencyMonitor
 from zs_constants import SCREEN_SIZE, FRAME_RATE, START_ENV, START_CONTROLLERS
 
 pygame.init()
@@ -16,10 +23,11 @@ class Game:
     and update them both at a regular interval.
     """
 
-    def __init__(self, screen, frame_rate, start_env):
+    def __init__(self, screen, frame_rate, start_env, fixed_dt=None):
         self.environment = start_env
         self.screen = screen
         self.frame_rate = frame_rate
+        self.fixed_dt = fixed_dt
 
     '''This method is necessary to poll and clear the Pygame events queue, as well as
     checking for QUIT events to close the program'''
@@ -27,24 +35,43 @@ class Game:
     def poll_events():
         # PYGAME CHOKE POINT
 
-        for event in pygame.event.get():
+        events = pygame.event.get()
+
+        for event in events:
             if event.type == pygame.QUIT:
                 exit()
 
+        InputSnapshot.sample(events)
+
     def main(self):
         # PYGAME CHOKE POINT
 
         clock = pygame.time.Clock()         # clock object used to set max frame_rate
+        replay = Controller.REPLAY
+        frames = 0
+        start = perf_counter()
 
         while True:
             self.poll_events()
             self.main_routine(clock)
             pygame.display.flip()
 
+            if LatencyMonitor.ACTIVE:
+                LatencyMonitor.ACTIVE.on_flip()
+
+            frames += 1
+            if replay and replay.finished:
+                t = perf_counter() - start
+                print("replayed {} frames in {:.3f}s ({:.1f} fps)".format(
+                    frames, t, frames / t))
+                exit()
+
     def main_routine(self, clock=None):
         # print("\n\n======================")
         if clock:                           # dt value can be printed to stdout or passed to data model
             dt = clock.tick(self.frame_rate) / 1000
+            if self.fixed_dt:               # recordings and replays use the same dt every frame
+                dt = self.fixed_dt
             self.environment.model["dt"] = dt
             # print(dt)
 
@@ -73,10 +100,38 @@ class Game:
 
 
 if __name__ == "__main__":
+    # --record writes every controller's input to a file, and --replay plays it back without
+    # waiting on the frame rate, then prints the time taken. Replays can run headless with
+    # SDL_VIDEODRIVER=dummy and SDL_AUDIODRIVER=dummy set. --latency times each input change
+    # to the display.flip that first shows a response, and prints histograms on exit
+    parser = ArgumentParser()
+    parser.add_argument("--record", metavar="FILE")
+    parser.add_argument("--replay", metavar="FILE")
+    parser.add_argument("--latency", action="store_true")
+    args = parser.parse_args()
+
+    if args.latency:
+        LatencyMonitor.ACTIVE = LatencyMonitor()
+        atexit.register(lambda: print(LatencyMonitor.ACTIVE.report()))
+
+    frame_rate = FRAME_RATE
+    fixed_dt = None
+
+    if args.record:
+        Controller.RECORDER = InputRecorder(args.record)
+        atexit.register(Controller.RECORDER.close)
+        fixed_dt = 1 / FRAME_RATE
+
+    if args.replay:
+        Controller.REPLAY = InputReplay(args.replay)
+        frame_rate = 0
+        fixed_dt = 1 / FRAME_RATE
+
     game = Game(
         pygame.display.set_mode(SCREEN_SIZE),
-        FRAME_RATE,
-        Environment(START_ENV, *START_CONTROLLERS)
+        frame_rate,
+        Environment(START_ENV, *START_CONTROLLERS),
+        fixed_dt
     )
 
     while True:
@@ -17,6 +17,12 @@ class CameraLayer(Layer):
         self.track_function = None
         self.scale_function = None
 
+        # with a margin set, sprites in this layer's groups and its sub
+        # layers' groups are told whether they're within the view rect
+        # plus the margin, so out of view sprites can skip some updates
+        self.lod_margin = None
+        self.lod_items = {}
+
     def get_screen_px(self, world_px):
         wx, wy = world_px
 
@@ -76,6 +82,59 @@ class CameraLayer(Layer):
     def set_target(self, name):
         self.target_name = name
 
+    def set_lod_margin(self, value):
+        self.lod_margin = value
+
+        if value is None:
+            self.clear_lod()
+
+    # drops this camera from every sprite it's checked, so they don't stay
+    # out of view after it stops checking them
+    def clear_lod(self):
+        for item in self.lod_items.values():
+            item.set_in_view(self, None)
+
+        self.lod_items = {}
+
+    def get_lod_groups(self, layer=None):
+        if layer is None:
+            layer = self
+
+        groups = list(layer.groups)
+
+        for sub_layer in layer.sub_layers:
+            groups += self.get_lod_groups(sub_layer)
+
+        return groups
+
+    def update_lod(self):
+        m = self.lod_margin
+        l, t, r, b = self.view_rect.get_bounds()
+        l -= m
+        t -= m
+        r += m
+        b += m
+
+        checked = {}
+
+        for group in self.get_lod_groups():
+            for item in group:
+                if id(item) in checked or not hasattr(item, "set_in_view"):
+                    continue
+
+                checked[id(item)] = item
+                il, it, ir, ib = item.rect.get_bounds()
+
+                item.set_in_view(
+                    self, ir >= l and il <= r and ib >= t and it <= b)
+
+        # sprites that have left this camera's groups
+        for key, item in self.lod_items.items():
+            if key not in checked:
+                item.set_in_view(self, None)
+
+        self.lod_items = checked
+
     def get_view_rect(self):
         return self.view_rect.copy()
 
@@ -139,6 +198,9 @@ class CameraLayer(Layer):
                 canvas.blit(item.image, (x, y))
 
     def update(self):
+        if self.lod_margin is not None:
+            self.update_lod()
+
         super(CameraLayer, self).update()
 
         if self.track_function:
@@ -1,4 +1,20 @@
 from geometry import Vector
+from latency import LatencyMonitor
+
+# PhysicsWorld objects store their bodies in numpy arrays. The rest of the
+# engine doesn't need numpy, so the world is only available if it's installed
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# bodies moving slower than SLEEP_VELOCITY for SLEEP_FRAMES consecutive
+# frames are put to sleep until a force, collision or controller input
+# wakes them
+
+SLEEP_VELOCITY = .05
+SLEEP_FRAMES = 30
 
 
 class PhysicsInterface:
@@ -14,6 +30,13 @@ class PhysicsInterface:
         self.forces = []
         self.last_position = 0, 0
 
+        self.asleep = False
+        self.still_frames = 0
+
+        # set by a force from a controller, so the LatencyMonitor counts the
+        # next move as a response to input
+        self.input_response = False
+
     def set_interface(self):
         entity = self.entity
 
@@ -24,6 +47,39 @@ class PhysicsInterface:
         entity.set_elasticity = self.set_elasticity
         entity.apply_force = self.apply_force
         entity.scale_movement_in_direction = self.scale_movement_in_direction
+        entity.is_asleep = self.is_asleep
+        entity.is_still = self.is_still
+        entity.wake = self.wake
+
+    def is_asleep(self):
+        return self.asleep
+
+    # a body that's asleep or didn't move this frame has no movement to
+    # resolve a wall collision along, so it isn't tested against walls
+    def is_still(self):
+        if self.asleep:
+            return True
+
+        return self.entity.position == self.last_position
+
+    def wake(self):
+        self.asleep = False
+        self.still_frames = 0
+
+    def sleep(self):
+        self.asleep = True
+        self.velocity = Vector(self.entity.name + " velocity", 0, 0)
+        self.forces = []
+
+    def update_sleep(self, speed):
+        if speed < SLEEP_VELOCITY:
+            self.still_frames += 1
+
+            if self.still_frames >= SLEEP_FRAMES:
+                self.sleep()
+
+        else:
+            self.still_frames = 0
 
     def get_instantaneous_velocity(self):
         entity = self.entity
@@ -50,7 +106,18 @@ class PhysicsInterface:
     def scale_movement_in_direction(self, angle, value):
         self.velocity.scale_in_direction(angle, value)
 
-    def apply_force(self, i, j):
+    # a zero force from a controller is still kept as a response when the
+    # body is awake, since letting go changes how it moves
+    def apply_force(self, i, j, from_input=False):
+        if from_input and (i or j or not self.asleep):
+            self.input_response = True
+
+        if not (i or j):
+            return
+
+        if self.asleep:
+            self.wake()
+
         self.forces.append(
             Vector("acceleration force", i, j)
         )
@@ -71,11 +138,20 @@ class PhysicsInterface:
     def apply_velocity(self):
         if self.mass:
             movement = self.velocity.get_copy(
-                scale=(1 / self.mass)).get_value()
-            self.entity.move(movement)
+                scale=(1 / self.mass))
+            self.entity.move(movement.get_value())
+
+            return movement.get_magnitude()
+
+        return 0
 
     def update(self):
         self.last_position = self.entity.position
+        response, self.input_response = self.input_response, False
+
+        if self.asleep:
+            return
+
         self.integrate_forces()
 
         # friction
@@ -87,7 +163,12 @@ class PhysicsInterface:
             self.apply_force(0, g)
 
         # movement
-        self.apply_velocity()
+        speed = self.apply_velocity()
+
+        if response and speed and LatencyMonitor.ACTIVE:
+            LatencyMonitor.ACTIVE.on_move(self.entity)
+
+        self.update_sleep(speed)
 
     @staticmethod
     def wall_velocity_test(wall, sprite):
@@ -104,8 +185,13 @@ class PhysicsInterface:
                 if collision:
                     return point
 
+    # with no displacement there's no movement to test along, and the
+    # skeleton test would snap a sprite resting across the wall to it
     @staticmethod
     def test_wall_collision(wall, sprite):
+        if not any(sprite.get_velocity().get_value()):
+            return None
+
         v_test = PhysicsInterface.wall_velocity_test(wall, sprite)
 
         if v_test:
@@ -155,33 +241,76 @@ class PhysicsInterface:
                     if b:
                         return w.end_point
 
+    # returns the sprite's position adjustment for a wall collision. Discrete
+    # collisions pass the collision point, and swept collisions pass a
+    # contact tuple. A contact with a time of impact of 0 is a sprite that
+    # already overlaps the wall, and it's pushed out along the contact normal
+    # by the contact's depth. Otherwise the part of the movement past the
+    # time of impact is scaled along the contact normal
     @staticmethod
-    def smooth_wall_collision(wall, sprite, point):
+    def get_wall_adjustment(wall, sprite, point, contact=None, scale=0):
         v = sprite.get_velocity()
 
-        sprite.move(
-            wall.get_normal_adjustment(
+        if not contact:
+            return wall.get_normal_adjustment(
                 v.apply_to_point(point)
             )
-        )
 
-        normal = wall.get_normal()
-        sprite.scale_movement_in_direction(
-            normal.get_angle(), 0)
+        toi, normal, depth = contact
+        nx, ny = normal.get_value()
+
+        if not toi:
+            return depth * nx, depth * ny
+
+        i, j = v.get_value()
+        d = ((i * nx) + (j * ny)) * (1 - toi) * (scale - 1)
 
+        return d * nx, d * ny
+
+    # returns the normal that the sprite's velocity is scaled along for a wall
+    # collision, or None if the sprite overlaps the wall but is already
+    # moving away from it
     @staticmethod
-    def bounce_wall_collision(wall, sprite, point):
-        v = sprite.get_velocity()
+    def get_wall_normal(wall, sprite, contact=None):
+        if not contact:
+            return wall.get_normal()
+
+        toi, normal, depth = contact
+
+        if not toi:
+            i, j = sprite.physics_interface.velocity.get_value()
+            nx, ny = normal.get_value()
 
+            if (i * nx) + (j * ny) >= 0:
+                return None
+
+        return normal
+
+    @staticmethod
+    def smooth_wall_collision(wall, sprite, point, contact=None):
         sprite.move(
-            wall.get_normal_adjustment(
-                v.apply_to_point(point)
-            )
+            PhysicsInterface.get_wall_adjustment(
+                wall, sprite, point, contact)
         )
 
-        normal = wall.get_normal()
-        sprite.scale_movement_in_direction(
-            normal.get_angle(), -1)
+        normal = PhysicsInterface.get_wall_normal(wall, sprite, contact)
+
+        if normal:
+            sprite.scale_movement_in_direction(
+                normal.get_angle(), 0)
+
+    @staticmethod
+    def bounce_wall_collision(wall, sprite, point, contact=None):
+        sprite.move(
+            PhysicsInterface.get_wall_adjustment(
+                wall, sprite, point, contact, scale=-1)
+        )
+
+        normal = PhysicsInterface.get_wall_normal(wall, sprite, contact)
+
+        if normal:
+            sprite.scale_movement_in_direction(
+                normal.get_angle(), -1)
 
     @staticmethod
     def test_sprite_collision(sprite, other):
@@ -207,6 +336,13 @@ class PhysicsInterface:
 
                 return v
 
+            def wake_on_contact(s, o):
+                if s.is_asleep():
+                    speed = o.get_velocity().get_magnitude()
+
+                    if speed >= SLEEP_VELOCITY:
+                        s.wake()
+
             def do_adjustment(s, o):
                 v = get_adjustment(o)
 
@@ -216,5 +352,337 @@ class PhysicsInterface:
                 v.scale(1 - s.physics_interface.elasticity)
                 s.apply_force(*v.get_value())
 
+            wake_on_contact(sprite, other)
+            wake_on_contact(other, sprite)
+
             do_adjustment(sprite, other)
             do_adjustment(other, sprite)
+
+
+class PhysicsBody(PhysicsInterface):
+    """
+    A PhysicsBody is a thin handle into a PhysicsWorld. It exposes the same
+    interface as PhysicsInterface but its mass, velocity, friction, gravity
+    and accumulated force are read from and written to the world's arrays
+    at its index. Integration is done by PhysicsWorld.step() so the update
+    method does nothing.
+    """
+    def __init__(self, entity, world, index):
+        self.world = world
+        self.index = index
+
+        super(PhysicsBody, self).__init__(entity)
+
+    @property
+    def mass(self):
+        return float(self.world.mass[self.index])
+
+    @mass.setter
+    def mass(self, value):
+        self.world.mass[self.index] = value
+
+    @property
+    def friction(self):
+        return float(self.world.friction[self.index])
+
+    @friction.setter
+    def friction(self, value):
+        self.world.friction[self.index] = value
+
+    @property
+    def gravity(self):
+        return float(self.world.gravity[self.index])
+
+    @gravity.setter
+    def gravity(self, value):
+        self.world.gravity[self.index] = value
+
+    @property
+    def asleep(self):
+        return bool(self.world.asleep[self.index])
+
+    @asleep.setter
+    def asleep(self, value):
+        self.world.asleep[self.index] = value
+
+    @property
+    def still_frames(self):
+        return int(self.world.still_frames[self.index])
+
+    @still_frames.setter
+    def still_frames(self, value):
+        self.world.still_frames[self.index] = value
+
+    @property
+    def velocity(self):
+        i, j = self.world.velocity[self.index]
+
+        return Vector(self.entity.name + " velocity", float(i), float(j))
+
+    @velocity.setter
+    def velocity(self, vector):
+        self.world.velocity[self.index] = vector.get_value()
+
+    @property
+    def forces(self):
+        i, j = self.world.forces[self.index]
+
+        return [Vector("acceleration force", float(i), float(j))]
+
+    @forces.setter
+    def forces(self, forces):
+        i, j = 0, 0
+
+        for f in forces:
+            i += f.i_hat
+            j += f.j_hat
+
+        self.world.forces[self.index] = i, j
+
+    def scale_movement_in_direction(self, angle, value):
+        velocity = self.velocity
+        velocity.scale_in_direction(angle, value)
+        self.velocity = velocity
+
+    def apply_force(self, i, j, from_input=False):
+        if from_input and (i or j or not self.asleep):
+            self.input_response = True
+
+        if not (i or j):
+            return
+
+        if self.asleep:
+            self.wake()
+
+        self.world.forces[self.index] += i, j
+
+    def update(self):
+        pass
+
+
+class PhysicsWorld:
+    """
+    A PhysicsWorld object stores the mass, velocity, accumulated force,
+    friction and gravity of each of its bodies in contiguous arrays so that
+    every body can be integrated in one vectorized step instead of one
+    PhysicsInterface.update() call per entity.
+
+    Adding an entity replaces its physics_interface with a PhysicsBody handle
+    (carrying over its current state) and removing it gives it back a plain
+    PhysicsInterface. Rows are kept packed, so removing a body moves the last
+    body into its index.
+
+    Sleeping bodies are masked out of integration and aren't moved, so a
+    world made mostly of resting props only pays for the bodies in motion.
+
+    The smallest side of each body's collision rect is measured once, when
+    it's added, so picking substeps doesn't need to make collision rects.
+    """
+    START_SIZE = 64
+    ARRAYS = ("mass", "friction", "gravity", "velocity", "forces",
+              "asleep", "still_frames", "size")
+
+    def __init__(self, name, size=START_SIZE):
+        if np is None:
+            raise ImportError("PhysicsWorld requires numpy")
+
+        self.name = name
+        self.bodies = []
+        self._entities = {}
+
+        self.mass = np.ones(size)
+        self.friction = np.ones(size)
+        self.gravity = np.zeros(size)
+        self.velocity = np.zeros((size, 2))
+        self.forces = np.zeros((size, 2))
+        self.asleep = np.zeros(size, dtype=bool)
+        self.still_frames = np.zeros(size, dtype=int)
+        self.size = np.zeros(size)
+
+    def __repr__(self):
+        return "PhysicsWorld: {} ({} bodies)".format(
+            self.name, len(self.bodies))
+
+    def __contains__(self, entity):
+        return id(entity) in self._entities
+
+    def grow(self):
+        size = len(self.mass) * 2
+
+        for name in self.ARRAYS:
+            old = getattr(self, name)
+            new = np.zeros((size,) + old.shape[1:], dtype=old.dtype)
+            new[:len(old)] = old
+            setattr(self, name, new)
+
+    @staticmethod
+    def copy_state(source, target):
+        target.mass = source.mass
+        target.elasticity = source.elasticity
+        target.gravity = source.gravity
+        target.friction = source.friction
+        target.velocity = source.velocity
+        target.forces = source.forces
+        target.last_position = source.last_position
+        target.asleep = source.asleep
+        target.still_frames = source.still_frames
+        target.input_response = source.input_response
+
+    def add_body(self, entity):
+        if entity in self:
+            return self._entities[id(entity)]
+
+        index = len(self.bodies)
+        if index == len(self.mass):
+            self.grow()
+
+        body = PhysicsBody(entity, self, index)
+        self.copy_state(entity.physics_interface, body)
+        self.size[index] = min(entity.get_collision_rect().size)
+
+        self.bodies.append(body)
+        self._entities[id(entity)] = body
+
+        entity.physics_interface = body
+        body.set_interface()
+
+        return body
+
+    def remove_body(self, entity):
+        body = self._entities.pop(id(entity))
+        interface = PhysicsInterface(entity)
+        self.copy_state(body, interface)
+
+        i = body.index
+        last = len(self.bodies) - 1
+
+        if i != last:
+            moved = self.bodies[last]
+
+            for name in self.ARRAYS:
+                a = getattr(self, name)
+                a[i] = a[last]
+
+            moved.index = i
+            self.bodies[i] = moved
+
+        self.bodies.pop()
+
+        entity.physics_interface = interface
+        interface.set_interface()
+
+    # adds and removes bodies so that the world contains exactly the
+    # entities passed
+    def set_bodies(self, entities):
+        current = {id(e): e for e in entities}
+
+        for body in [b for b in self.bodies if id(b.entity) not in current]:
+            self.remove_body(body.entity)
+
+        for entity in entities:
+            if entity not in self:
+                self.add_body(entity)
+
+    def get_awake_count(self):
+        n = len(self.bodies)
+
+        return n - int(self.asleep[:n].sum())
+
+    def get_max_speed(self):
+        n = len(self.bodies)
+        if not n:
+            return 0
+
+        mass = self.mass[:n]
+        inverse = np.divide(
+            1, mass, out=np.zeros(n), where=mass != 0)
+        speed = np.hypot(
+            self.velocity[:n, 0], self.velocity[:n, 1]) * inverse
+
+        return float(speed.max())
+
+    # returns the smallest body size of the awake bodies, or 0 if none are
+    # awake
+    def get_min_size(self):
+        n = len(self.bodies)
+        awake = ~self.asleep[:n]
+
+        if not awake.any():
+            return 0
+
+        return float(self.size[:n][awake].min())
+
+    # this is the vectorized equivalent of PhysicsInterface.update()
+    # for every body in the world.
+    # dt is the fraction of a frame to integrate, so a frame split into
+    # substeps scales movement, friction and gravity by each step's share.
+    # Moves made in response to input are reported on the first step of a
+    # frame, and sleep is only checked on the last
+    def step(self, dt=1, last=True, first=True):
+        n = len(self.bodies)
+        if not n:
+            return
+
+        awake = ~self.asleep[:n]
+        mass = self.mass[:n]
+        velocity = self.velocity[:n]
+        forces = self.forces[:n]
+
+        velocity += forces
+        forces[:] = 0
+
+        # friction
+        if dt == 1:
+            velocity *= self.friction[:n, None]
+        else:
+            velocity *= self.friction[:n, None] ** dt
+
+        # gravity
+        forces[:, 1] += self.gravity[:n] * mass * awake * dt
+
+        # movement
+        inverse = np.divide(
+            1, mass, out=np.zeros(n), where=mass != 0)
+        movement = velocity * inverse[:, None]
+        active = np.flatnonzero(awake)
+        bodies = self.bodies
+
+        for k, (dx, dy) in zip(active.tolist(),
+                               (movement[active] * dt).tolist()):
+            body = bodies[k]
+            entity = body.entity
+            body.last_position = entity.position
+            response = False
+
+            if first:
+                response, body.input_response = body.input_response, False
+
+            if dx or dy:
+                entity.move((dx, dy))
+
+                if response and LatencyMonitor.ACTIVE:
+                    LatencyMonitor.ACTIVE.on_move(entity)
+
+        if last:
+            self.update_sleep(movement)
+
+    def update_sleep(self, movement):
+        n = len(self.bodies)
+        bodies = self.bodies
+        velocity = self.velocity[:n]
+        forces = self.forces[:n]
+        awake = ~self.asleep[:n]
+
+        still = self.still_frames[:n]
+        slow = np.hypot(movement[:, 0], movement[:, 1]) < SLEEP_VELOCITY
+        still[:] = np.where(slow & awake, still + 1, 0)
+
+        falling_asleep = still >= SLEEP_FRAMES
+        if falling_asleep.any():
+            self.asleep[:n] |= falling_asleep
+            velocity[falling_asleep] = 0
+            forces[falling_asleep] = 0
+            still[falling_asleep] = 0
+
+            for k in np.flatnonzero(falling_asleep).tolist():
+                bodies[k].last_position = bodies[k].entity.position
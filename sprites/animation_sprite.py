@@ -13,6 +13,8 @@ ANIMATION_CLASS_DICT = {
 }
 
 BASE_SPEED = 2.5
+COLLISION_CATEGORY = 1
+COLLISION_MASK = 0xFFFF
 
 
 class AnimationSprite(Sprite):
@@ -35,8 +37,18 @@ class AnimationSprite(Sprite):
         self.physics_interface = PhysicsInterface(self)
         self.physics_interface.set_interface()
 
+        # the last force handle_movement applied from the controller
+        self.input_force = None
+
         self.hitbox_manager = HitboxManager(self)
 
+        self.collision_category = COLLISION_CATEGORY
+        self.collision_mask = COLLISION_MASK
+
+        # whether each camera layer with level of detail on can see the
+        # sprite. It's out of view when every one of them says it isn't
+        self.view_cameras = {}
+
     def get_collision_skeleton(self):
         rect = self.get_collision_rect()
 
@@ -54,10 +66,12 @@ class AnimationSprite(Sprite):
         return self.physics_interface.last_position
 
     def get_collision_rect(self):
-        hitbox = self.animation_machine.get_hitboxes("body")
-        hitbox = hitbox[0]
+        templates, (ox, oy) = self.animation_machine.get_hitbox_templates(
+            "body")
+        hitbox = templates[0]
+        x, y = hitbox["position"]
 
-        rect = Rect(hitbox["size"], hitbox["position"])
+        rect = Rect(hitbox["size"], (x + ox, y + oy))
 
         last = self.physics_interface.get_instantaneous_velocity()
         last.rotate(.5)
@@ -79,12 +93,61 @@ class AnimationSprite(Sprite):
     def get_animation_state(self):
         return self.animation_machine.get_animation_state()
 
+    # hitbox recomputations saved by the animation machine's cache last frame
+    def get_hitbox_cache_hits(self):
+        return self.animation_machine.get_hitbox_cache_stats()[0]
+
     def get_animation_value(self, key, state=None):
         if self.animation_machine:
 
             return self.animation_machine.get_animation(
                 state=state)[key]
 
+    # categories are names from the collision_categories table or ints
+    # collision_category: enemy
+    # collision_mask: player, projectile
+    def set_collision_category(self, *categories):
+        self.collision_category = self.get_collision_bits(categories)
+
+    def set_collision_mask(self, *categories):
+        self.collision_mask = self.get_collision_bits(categories)
+
+    @staticmethod
+    def get_collision_bits(categories):
+        table = load_resource("tables")["collision_categories"]
+        bits = 0
+
+        for c in categories:
+            if c == "all":
+                c = COLLISION_MASK
+
+            elif type(c) is str:
+                c = table[c]
+
+            bits |= c
+
+        return bits
+
+    # two sprites can collide if each one's category is in the other's mask
+    @staticmethod
+    def check_collision_mask(sprite, other):
+        return (sprite.collision_category & other.collision_mask and
+                other.collision_category & sprite.collision_mask)
+
+    # a value of None drops the camera, for cameras that stop checking
+    # the sprite
+    def set_in_view(self, camera, value):
+        if value is None:
+            self.view_cameras.pop(camera, None)
+
+        else:
+            self.view_cameras[camera] = value
+
+    def is_in_view(self):
+        cameras = self.view_cameras
+
+        return not cameras or True in cameras.values()
+
     def set_base_speed(self, value):
         self.base_speed = value
 
@@ -130,7 +193,8 @@ class AnimationSprite(Sprite):
 
         self.animation_machine.set_animations(animation_file)
         self.graphics.set_animations(
-            self.animation_machine.animations
+            self.animation_machine.animations,
+            self.animation_machine.definition_key
         )
 
     # UPDATE ROUTINE METHODS
@@ -140,6 +204,8 @@ class AnimationSprite(Sprite):
 
         if self.animation_machine:
             um += [
+                self.update_view,
+                self.wake_on_input,
                 self.animation_machine.update,
                 self.update_face_direction,
                 self.handle_movement,
@@ -149,6 +215,19 @@ class AnimationSprite(Sprite):
 
         return um
 
+    # out of view sprites still run their state machine and movement, but
+    # their animation machine puts off working out the animation frame until
+    # it's needed, and they don't play sounds. Hitboxes and collision rects
+    # refresh the machine, so sprites in collision systems save little
+    def update_view(self):
+        self.animation_machine.set_in_view(self.is_in_view())
+
+    def wake_on_input(self):
+        controller = self.controller
+
+        if controller and self.is_asleep() and controller.is_active():
+            self.wake()
+
     def update_face_direction(self):
         controller = self.controller
         machine = self.animation_machine
@@ -161,7 +240,11 @@ class AnimationSprite(Sprite):
 
             if state in face:
                 if dpad.held:
-                    self.face_direction = dpad.get_direction()
+                    direction = dpad.get_direction()
+
+                    if direction != self.face_direction:
+                        self.face_direction = direction
+                        machine.request_refresh()
 
     def handle_movement(self):
         controller = self.controller
@@ -185,23 +268,26 @@ class AnimationSprite(Sprite):
                 x *= base_speed
                 y *= base_speed
 
-                self.physics_interface.apply_force(x, y)
+                # only a change in the force is a response to input. The
+                # same force as last frame is a held direction
+                self.physics_interface.apply_force(
+                    x, y, from_input=(x, y) != self.input_force)
+                self.input_force = x, y
+
+            else:
+                self.input_force = None
 
     def handle_sounds(self):
         sounds = self.sounds
         machine = self.animation_machine
 
-        state = machine.get_state()
+        if not machine.in_view:
+            return
 
+        state = machine.get_state()
         d = machine.get_animation()
-        sound_frame = d.get("sound_frame", 0)
-        state_frame = machine.get_state_frame()
-        ani_frame = machine.get_animation_frame()
-        l = len(d["frames"])
-
-        hear = sound_frame == ani_frame and state_frame % l == 0
 
-        if state in sounds and hear:
+        if state in sounds and machine.sound_trigger:
             if not d.get("sound_overlap", True):
                 sounds[state].stop()
             sounds[state].play()
@@ -259,52 +345,105 @@ class HitboxManager:
     def __init__(self, entity):
         self.entity = entity
 
+    # damage hitboxes are tested from the shared templates, and only the
+    # ones that hit are made into dicts at the sprite's position
     def get_hitbox_collisions(self, other):
-        hitboxes = self.entity.animation_machine.get_hitboxes(key="damage")
+        machine = self.entity.animation_machine
+        templates, (ox, oy) = machine.get_hitbox_templates("damage")
         hurtboxes = other.animation_machine.get_hitboxes(key="hurtbox")
         rects = [other.get_collision_rect()] + hurtboxes
 
         collisions = []
 
-        for h in hitboxes:
+        for h in templates:
+            x, y = h["position"]
+            position = x + ox, y + oy
+
             if "size" in h:
-                r = Rect(h["size"], h["position"])
+                r = Rect(h["size"], position)
 
                 collision = any(
                     [r.get_rect_collision(o) for o in rects]
                 )
 
                 if collision:
-                    collisions.append(h)
+                    collisions.append(
+                        machine.place_hitbox(h, (ox, oy)))
 
             if "radius" in h:
                 r = other.get_collision_rect()
                 radius = h["radius"]
-                position = h["position"]
 
                 collision = any(
                     [r.get_circle_collision(radius, position) for r in rects]
                 )
 
                 if collision:
-                    collisions.append(h)
+                    collisions.append(
+                        machine.place_hitbox(h, (ox, oy)))
 
         return collisions
 
+    # returns the bounds of the sprite's collision rect and all of its
+    # hitboxes as a (left, top, right, bottom) tuple
+    @staticmethod
+    def get_hitbox_bounds(sprite):
+        left, top, right, bottom = sprite.get_collision_rect().get_bounds()
+        templates, (ox, oy) = (
+            sprite.animation_machine.get_hitbox_templates())
+
+        for h in templates:
+            x, y = h["position"]
+            x, y = x + ox, y + oy
+
+            if "size" in h:
+                w, hh = h["size"]
+                bounds = x, y, x + w, y + hh
+
+            else:
+                r = h["radius"]
+                bounds = x - r, y - r, x + r, y + r
+
+            left = min(left, bounds[0])
+            top = min(top, bounds[1])
+            right = max(right, bounds[2])
+            bottom = max(bottom, bounds[3])
+
+        return left, top, right, bottom
+
     def handle_hitboxes(self, hitboxes):
         # print("\n---")
         # for h in hitboxes:
             # print(h)
 
+        self.entity.wake()
         self.entity.animation_machine.set_state("hurt")
 
+    # returns a tuple of each sprite's hitboxes that hit the other sprite,
+    # or False if neither sprite hits the other
     @staticmethod
-    def do_hitbox_collision(sprite, other):
+    def test_hitbox_collision(sprite, other):
         s_collisions = sprite.hitbox_manager.get_hitbox_collisions(other)
         o_collisions = other.hitbox_manager.get_hitbox_collisions(sprite)
 
+        if s_collisions or o_collisions:
+            return s_collisions, o_collisions
+
+        return False
+
+    @staticmethod
+    def handle_hitbox_collision(sprite, other, collision):
+        s_collisions, o_collisions = collision
+
         if s_collisions:
             other.hitbox_manager.handle_hitboxes(s_collisions)
 
         if o_collisions:
             sprite.hitbox_manager.handle_hitboxes(o_collisions)
+
+    @staticmethod
+    def do_hitbox_collision(sprite, other):
+        collision = HitboxManager.test_hitbox_collision(sprite, other)
+
+        if collision:
+            HitboxManager.handle_hitbox_collision(sprite, other, collision)
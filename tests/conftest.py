@@ -0,0 +1,59 @@
+import os
+import sys
+
+# resources are loaded from paths relative to the project root, and the
+# graphics need a display, so the tests run from the root with SDL's dummy
+# video and audio drivers
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+os.chdir(ROOT)
+sys.path.insert(0, ROOT)
+
+import pygame
+import pytest
+
+pygame.init()
+pygame.display.set_mode((1, 1))
+
+SHEET_SIZE = 800, 800
+TEST_ANIMATION = {
+    "sprite_sheet": "test_sheet.png",
+    "state_transitions": "demo_sprite.cfg",
+    "scale": 1,
+    "class": "udlr_machine"
+}
+
+
+# returns a function that makes AnimationSprites using the demo sprite's
+# animations and state transitions, drawn from a blank sprite sheet
+@pytest.fixture
+def make_sprite(monkeypatch):
+    import animation
+    from sprites.animation_sprite import AnimationSprite
+
+    load_resource = animation.load_resource
+
+    def load_test_sheet(file_name):
+        if file_name == TEST_ANIMATION["sprite_sheet"]:
+            return pygame.Surface(SHEET_SIZE)
+
+        return load_resource(file_name)
+
+    monkeypatch.setattr(animation, "load_resource", load_test_sheet)
+
+    def make(name, position=(0, 0), controller=None):
+        sprite = AnimationSprite(name)
+
+        if controller:
+            sprite.set_controller(controller)
+
+        sprite.set_animation(dict(TEST_ANIMATION))
+        sprite.set_position(*position)
+        sprite.animation_machine.set_state("idle")
+
+        return sprite
+
+    return make
@@ -0,0 +1,57 @@
+from geometry import SpatialHash, SweepAndPrune
+
+
+class Item:
+    def __init__(self, name):
+        self.name = name
+
+
+# returns items in a row, each overlapping the next, named by their place in
+# the row. They're in the reverse of their id order, so pairs ordered by id
+# would come out backwards
+def get_entries(count):
+    items = sorted([Item(None) for i in range(count)], key=id, reverse=True)
+
+    for i, item in enumerate(items):
+        item.name = str(i)
+
+    return [(item, (i * 10, 0, i * 10 + 15, 15))
+            for i, item in enumerate(items)]
+
+
+def get_names(pairs):
+    return [(a.name, b.name) for a, b in pairs]
+
+
+def test_spatial_hash_pairs_follow_insertion_order():
+    entries = get_entries(6)
+    broadphase = SpatialHash(cell_size=16)
+    broadphase.set_items(entries)
+
+    assert get_names(broadphase.get_pairs()) == [
+        ("0", "1"), ("1", "2"), ("2", "3"), ("3", "4"), ("4", "5")]
+
+    query = broadphase.query((25, 0, 30, 5))
+    assert query == [entries[1][0], entries[2][0], entries[3][0]]
+
+
+def test_sweep_and_prune_pairs_follow_insertion_order():
+    entries = get_entries(6)
+    broadphase = SweepAndPrune()
+    broadphase.set_items(entries)
+
+    assert get_names(broadphase.get_pairs()) == [
+        ("0", "1"), ("1", "2"), ("2", "3"), ("3", "4"), ("4", "5")]
+
+    broadphase.set_items(entries[:4])
+    broadphase.get_pairs()
+    assert get_names(broadphase.removed) == [("3", "4"), ("4", "5")]
+
+
+def test_sweep_and_prune_two_groups_order():
+    entries = get_entries(6)
+    broadphase = SweepAndPrune()
+    broadphase.set_items(entries[1::2], entries[::2])
+
+    assert get_names(broadphase.get_pairs()) == [
+        ("1", "0"), ("1", "2"), ("3", "2"), ("3", "4"), ("5", "4")]
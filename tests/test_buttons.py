@@ -0,0 +1,49 @@
+from controller import Button, ButtonView, Controller, ControllerView
+
+
+def make_button():
+    controller = Controller("test controller")
+    button = Button("A", controller)
+
+    return controller, button
+
+
+def push(controller, button, *values):
+    for value in values:
+        controller.frame_count += 1
+        button.frames.append(value)
+        button.update()
+
+
+def test_held_from_start_isnt_lifted():
+    controller, button = make_button()
+    push(controller, button, 1, 1, 1)
+
+    assert not button.lifted
+    assert not button.check()
+
+    push(controller, button, 0, 1)
+    assert button.lifted
+    assert button.check()
+
+
+def test_view_needs_release_after_it_was_made():
+    controller, button = make_button()
+    push(controller, button, 0, 1)
+    view = ButtonView(button, ControllerView(controller))
+
+    push(controller, button, 1)
+    assert not view.lifted
+
+    push(controller, button, 0, 1)
+    assert view.lifted
+    assert view.check()
+
+
+def test_get_frames_is_the_cache():
+    controller, button = make_button()
+    push(controller, button, 0, 1, 1, 0)
+
+    assert button.get_frames() is button.frames
+    assert button.get_frames(2) == [1, 0]
+    assert button.get_frames(10) == [0, 1, 1, 0]
@@ -0,0 +1,56 @@
+import pytest
+
+from classes import ArrayCache, CacheList
+
+
+# checks a cache against a plain list trimmed to the last 'size' items
+@pytest.mark.parametrize("cls", [CacheList, ArrayCache])
+def test_matches_trimmed_list(cls):
+    size = 7
+    cache = cls(size)
+    items = []
+
+    for i in range(30):
+        cache.append(i % 100)
+        items = (items + [i % 100])[-size:]
+
+        assert len(cache) == len(items)
+        assert list(cache) == items
+        assert cache[:] == items
+        assert cache[2:-1] == items[2:-1]
+        assert cache[::2] == items[::2]
+        assert cache[-1] == items[-1]
+        assert cache.last(3) == items[-3:]
+
+
+def test_index_out_of_range():
+    cache = CacheList(3)
+    cache += [1, 2, 3, 4]
+
+    assert cache[0] == 2
+
+    with pytest.raises(IndexError):
+        cache[3]
+
+
+def test_set_size_keeps_newest():
+    cache = CacheList(5)
+    cache += range(8)
+
+    cache.set_size(3)
+    assert cache[:] == [5, 6, 7]
+
+    cache.set_size(6)
+    cache += [8, 9]
+    assert cache[:] == [5, 6, 7, 8, 9]
+
+
+def test_clear_and_zero_size():
+    cache = CacheList(3)
+    cache += [1, 2]
+    cache.clear()
+    assert cache[:] == []
+
+    empty = CacheList(0)
+    empty.append(1)
+    assert len(empty) == 0
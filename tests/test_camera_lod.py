@@ -0,0 +1,106 @@
+import pytest
+
+from classes import Group
+from collisions import CollisionManager
+from layers.camera_layer import CameraLayer
+
+
+def make_camera(group):
+    camera = CameraLayer("test camera")
+    camera.set_size(200, 200)
+    camera.set_view_position(0, 0)
+    camera.set_groups(group)
+    camera.set_lod_margin(16)
+
+    return camera
+
+
+def make_pair(make_sprite, group, x, y):
+    sprites = make_sprite("a", (x, y)), make_sprite("b", (x + 4, y))
+
+    for sprite in sprites:
+        sprite.set_group(group)
+        sprite.physics_interface.last_position = sprite.position
+
+    return sprites
+
+
+def test_in_view_only_leaves_out_of_view_sprites_out(make_sprite):
+    group = Group("sprite group")
+    a, b = make_pair(make_sprite, group, 1000, 1000)
+    camera = make_camera(group)
+    system = CollisionManager.get_from_dict({
+        "name": "test hitbox system",
+        "collision_system": "sprite_hitbox",
+        "broadphase": "spatial_hash",
+        "in_view_only": True,
+        "group_a": group
+    })
+
+    camera.update_lod()
+    system.update()
+    assert not a.is_in_view()
+    assert system.get_pairs_tested() == 0
+
+    camera.set_view_position(950, 950)
+    camera.update_lod()
+    system.update()
+    assert a.is_in_view()
+    assert system.get_pairs_tested() == 1
+
+
+@pytest.mark.parametrize("system_name", ["sprite_sprite", "sprite_hitbox"])
+def test_systems_keep_out_of_view_sprites(make_sprite, system_name):
+    group = Group("sprite group")
+    make_pair(make_sprite, group, 1000, 1000)
+    camera = make_camera(group)
+    system = CollisionManager.get_from_dict({
+        "name": "test system",
+        "collision_system": system_name,
+        "group_a": group
+    })
+
+    camera.update_lod()
+    system.update()
+    assert system.get_pairs_tested() == 1
+
+
+def test_camera_dropped_from_sprites_it_stops_checking(make_sprite):
+    group = Group("sprite group")
+    a, b = make_pair(make_sprite, group, 1000, 1000)
+    camera = make_camera(group)
+
+    camera.update_lod()
+    assert not a.is_in_view() and not b.is_in_view()
+
+    group.remove_item(a)
+    camera.update_lod()
+    assert camera not in a.view_cameras
+    assert a.is_in_view() and not b.is_in_view()
+
+    camera.set_lod_margin(None)
+    assert b.view_cameras == {}
+    assert b.is_in_view()
+
+
+# a stale machine refreshes when its hitboxes are asked for, so they're the
+# same as an in view sprite's
+def test_stale_machine_gives_exact_hitboxes(make_sprite):
+    group = Group("sprite group")
+    seen = make_sprite("seen", (1000, 1000))
+    unseen = make_sprite("unseen", (1000, 1000))
+    unseen.set_group(group)
+    camera = make_camera(group)
+
+    camera.update_lod()
+    for sprite in (seen, unseen):
+        sprite.update()
+        sprite.animation_machine.set_state("walk")
+
+        for f in range(7):
+            sprite.update()
+
+    assert unseen.animation_machine.stale
+    assert (unseen.animation_machine.get_hitboxes("body") ==
+            seen.animation_machine.get_hitboxes("body"))
+    assert not unseen.animation_machine.stale
@@ -0,0 +1,87 @@
+from controller import Command, Step
+from zs_constants import CHARGE_TIME
+
+N, U, D, L, R = (0, 0), (0, -1), (0, 1), (-1, 0), (1, 0)
+DR = (1, 1)
+
+
+def make_command(steps, window):
+    return Command(
+        "test command", [Step.get_step_from_key(k) for k in steps],
+        ["Dpad", "A"], window)
+
+
+# returns the frames the command was active on
+def run(command, frames):
+    active = []
+
+    for t, frame in enumerate(frames):
+        command.update(frame)
+
+        if command.check():
+            active.append(t)
+
+    return active
+
+
+def dpad(*directions):
+    return [(d, 0) for d in directions]
+
+
+def test_double_tap():
+    command = make_command(["neutral", "right", "neutral", "right"], 20)
+
+    assert run(command, dpad(N, R, R, N, N, R, R)) == [5]
+
+
+def test_double_tap_outside_window():
+    command = make_command(["neutral", "right", "neutral", "right"], 20)
+    frames = dpad(N, R) + dpad(*[N] * 20) + dpad(R)
+
+    assert run(command, frames) == []
+
+
+def test_match_frames_arent_reused():
+    command = make_command(["neutral", "right", "neutral", "right"], 20)
+
+    # the second tap can't also be the first tap of another double tap
+    assert run(command, dpad(N, R, N, R, N, R)) == [3]
+
+
+def test_quarter_circle():
+    command = make_command(["down", "down_right", "right", "press"], 15)
+    frames = dpad(N, D, DR, R) + [(R, 1)]
+
+    assert run(command, frames) == [4]
+
+    command = make_command(["down", "down_right", "right", "press"], 15)
+    assert run(command, dpad(N, D, R) + [(R, 1)]) == []
+
+
+def test_charge():
+    command = make_command(["charge_left", "right", "press"], 20)
+    frames = dpad(*[L] * CHARGE_TIME) + dpad(R) + [(R, 1)]
+
+    assert run(command, frames) == [CHARGE_TIME + 1]
+
+
+def test_charge_too_short():
+    command = make_command(["charge_left", "right", "press"], 20)
+    frames = dpad(*[L] * (CHARGE_TIME - 1)) + dpad(R) + [(R, 1)]
+
+    assert run(command, frames) == []
+
+
+def test_charge_broken_by_neutral():
+    command = make_command(["charge_left", "right", "press"], 20)
+    half = CHARGE_TIME // 2
+    frames = dpad(*[L] * half + [N] + [L] * half) + dpad(R) + [(R, 1)]
+
+    assert run(command, frames) == []
+
+
+def test_charge_released_too_long_ago():
+    command = make_command(["charge_left", "right", "press"], 20)
+    frames = dpad(*[L] * CHARGE_TIME + [N] * 20) + dpad(R) + [(R, 1)]
+
+    assert run(command, frames) == []
@@ -0,0 +1,66 @@
+from collisions import CollisionManager
+
+
+def make_system(sprites, broadphase=None):
+    d = {
+        "name": "test system",
+        "collision_system": "sprite_sprite",
+        "group_a": sprites
+    }
+    if broadphase:
+        d["broadphase"] = broadphase
+
+    return CollisionManager.get_from_dict(d)
+
+
+def listen(sprite, events):
+    for name in ("on_collision_enter", "on_collision_exit"):
+        setattr(sprite, name,
+                lambda n=name: events.append((n, sprite.name)))
+
+
+def move_to(sprite, x, y):
+    sprite.set_position(x, y)
+    sprite.physics_interface.last_position = sprite.position
+
+
+def run_apart(make_sprite, broadphase):
+    events = []
+    a = make_sprite("a", (100, 100))
+    b = make_sprite("b", (104, 100))
+    listen(a, events)
+    listen(b, events)
+
+    for sprite in (a, b):
+        sprite.physics_interface.last_position = sprite.position
+
+    system = make_system([a, b], broadphase)
+    system.update()
+    entered = list(events)
+
+    move_to(b, 500, 100)
+    system.update()
+
+    return system, entered, events[len(entered):]
+
+
+def test_sweep_and_prune_removed_pairs_fire_exit(make_sprite):
+    system, entered, exited = run_apart(make_sprite, "sweep_and_prune")
+
+    assert sorted(entered) == [
+        ("on_collision_enter", "a"), ("on_collision_enter", "b")]
+    assert sorted(exited) == [
+        ("on_collision_exit", "a"), ("on_collision_exit", "b")]
+    assert len(system.broadphase.removed) == 1
+    assert len(system.contacts) == 0
+
+
+def test_exit_without_broadphase(make_sprite):
+    system, entered, exited = run_apart(make_sprite, None)
+
+    # every pair is tested without a broadphase, so the pair stays cached
+    # as apart
+    assert len(entered) == 2
+    assert sorted(exited) == [
+        ("on_collision_exit", "a"), ("on_collision_exit", "b")]
+    assert [c[2] for c in system.contacts.contacts.values()] == [False]
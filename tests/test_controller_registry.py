@@ -0,0 +1,31 @@
+from controller import ControllerRegistry
+from entities import Entity
+from resources import load_resource
+
+CONTROLLER = "default_controller_key.cfg"
+
+
+def test_entities_share_registered_controller():
+    ControllerRegistry.clear()
+    a, b = Entity("a"), Entity("b")
+    a.set_controller(CONTROLLER)
+    b.set_controller(CONTROLLER)
+
+    assert a.controller is not b.controller
+    assert a.controller.controller is b.controller.controller
+
+
+def test_devices_dict_stays_local():
+    ControllerRegistry.clear()
+    sprite, menu = Entity("sprite"), Entity("menu")
+    sprite.set_controller(CONTROLLER)
+    shared = ControllerRegistry.get_controller(CONTROLLER)
+
+    devices = dict(load_resource(CONTROLLER)["devices"])
+    devices["name"] = CONTROLLER
+    menu.set_controller(devices)
+
+    assert ControllerRegistry.get_controller(CONTROLLER) is shared
+    assert sprite.controller.controller is shared
+    assert menu.controller.controller is not shared
+    assert menu.controller.name == CONTROLLER
@@ -0,0 +1,34 @@
+from sprites.animation_sprite import HitboxManager
+
+
+def test_templates_are_shared_between_sprites(make_sprite):
+    a = make_sprite("a", (100, 100))
+    b = make_sprite("b", (300, 200))
+
+    templates, offset = a.animation_machine.get_hitbox_templates("body")
+    other, other_offset = b.animation_machine.get_hitbox_templates("body")
+
+    assert templates is other
+    assert offset == a.rect.topleft and other_offset == b.rect.topleft
+
+    a.position = a.position[0] + 5, a.position[1]
+    assert a.animation_machine.get_hitbox_templates("body")[0] is templates
+
+
+# the placed dicts are the templates moved by the sprite's position
+def test_hitboxes_match_placed_templates(make_sprite):
+    sprite = make_sprite("a", (100, 100))
+    machine = sprite.animation_machine
+    templates, (ox, oy) = machine.get_hitbox_templates()
+
+    assert len(templates) == len(machine.get_hitboxes()) > 0
+
+    for template, hitbox in zip(templates, machine.get_hitboxes()):
+        x, y = template["position"]
+
+        assert hitbox["position"] == (x + ox, y + oy)
+        assert dict(hitbox, position=template["position"]) == template
+
+    left, top = HitboxManager.get_hitbox_bounds(sprite)[:2]
+    assert left <= min(h["position"][0] for h in machine.get_hitboxes())
+    assert top <= min(h["position"][1] for h in machine.get_hitboxes())
@@ -0,0 +1,141 @@
+import pygame
+import pytest
+
+from input_manager import (
+    ButtonMappingButton, InputManager, InputSnapshot, KeyState)
+
+
+def key_event(event_type, key):
+    return pygame.event.Event(event_type, key=key)
+
+
+class FakeJoystick:
+    def __init__(self, instance_id, name="pad"):
+        self.instance_id = instance_id
+        self.name = name
+
+    def get_instance_id(self):
+        return self.instance_id
+
+    def get_name(self):
+        return self.name
+
+    def get_numbuttons(self):
+        return 2
+
+    def get_button(self, i):
+        return 0
+
+    def get_numaxes(self):
+        return 1
+
+    def get_axis(self, i):
+        return 0
+
+    def get_numhats(self):
+        return 0
+
+
+@pytest.fixture
+def event_snapshot(monkeypatch):
+    monkeypatch.setattr(InputSnapshot, "use_events", True)
+    monkeypatch.setattr(InputSnapshot, "keys", None)
+    monkeypatch.setattr(InputSnapshot, "joysticks", {})
+    monkeypatch.setattr(InputManager, "INPUT_DEVICES", [])
+
+    return InputSnapshot
+
+
+def test_tap_within_a_frame_is_latched():
+    keys = KeyState()
+
+    assert keys.handle_events([
+        key_event(pygame.KEYDOWN, pygame.K_a),
+        key_event(pygame.KEYUP, pygame.K_a)])
+    assert keys[pygame.K_a]
+
+    # released on the next frame, which counts as a change
+    assert keys.handle_events([])
+    assert not keys[pygame.K_a]
+    assert not keys.handle_events([])
+
+
+def test_held_key_isnt_latched_on_release():
+    keys = KeyState()
+    keys.handle_events([key_event(pygame.KEYDOWN, pygame.K_a)])
+    keys.handle_events([])
+    assert keys[pygame.K_a]
+
+    keys.handle_events([key_event(pygame.KEYUP, pygame.K_a)])
+    assert not keys[pygame.K_a]
+
+
+def test_resync_drops_keys_released_elsewhere(event_snapshot, monkeypatch):
+    event_snapshot.sample([
+        key_event(pygame.KEYDOWN, pygame.K_a),
+        key_event(pygame.KEYDOWN, pygame.K_b)])
+    assert event_snapshot.get_keys()[pygame.K_a]
+
+    # a modal loop reads the KEYUP for a, so sample never sees it
+    pressed = {pygame.K_a: False, pygame.K_b: True}
+    monkeypatch.setattr(pygame.key, "get_pressed", lambda: pressed)
+    version = event_snapshot.version
+    event_snapshot.resync()
+
+    keys = event_snapshot.get_keys()
+    assert not keys[pygame.K_a]
+    assert keys[pygame.K_b]
+    assert event_snapshot.version > version
+
+
+def test_joystick_events_use_instance_id(event_snapshot):
+    InputManager.INPUT_DEVICES.extend([FakeJoystick(7), FakeJoystick(3)])
+
+    event_snapshot.sample([pygame.event.Event(
+        pygame.JOYBUTTONDOWN, joy=0, instance_id=3, button=1)])
+
+    assert event_snapshot.joysticks[3].buttons == (0, 1)
+    assert 7 not in event_snapshot.joysticks
+
+
+def test_removed_joystick_is_released(event_snapshot):
+    joy = FakeJoystick(3)
+    InputManager.INPUT_DEVICES.append(joy)
+
+    event_snapshot.sample([
+        pygame.event.Event(
+            pygame.JOYBUTTONDOWN, joy=0, instance_id=3, button=0),
+        pygame.event.Event(
+            pygame.JOYAXISMOTION, joy=0, instance_id=3, axis=0, value=1.0)])
+    event_snapshot.sample([
+        pygame.event.Event(pygame.JOYDEVICEREMOVED, instance_id=3)])
+
+    state = event_snapshot.get_joystick(joy)
+    assert state.buttons == (0, 0)
+    assert state.axes == [0]
+    assert InputManager.INPUT_DEVICES == [None]
+
+    # events still queued for the unplugged joystick are ignored
+    version = event_snapshot.version
+    event_snapshot.sample([pygame.event.Event(
+        pygame.JOYBUTTONDOWN, joy=0, instance_id=3, button=0)])
+    assert event_snapshot.version == version
+    assert state.buttons == (0, 0)
+
+
+def test_mappings_keep_their_joystick_after_unplugging(event_snapshot):
+    a, b = FakeJoystick(7, "pad a"), FakeJoystick(3, "pad b")
+    InputManager.INPUT_DEVICES.extend([a, b])
+    mapping = ButtonMappingButton(1, "pad b", 1)
+
+    event_snapshot.sample([
+        pygame.event.Event(pygame.JOYDEVICEREMOVED, instance_id=7)])
+
+    # positions don't shift, so cfg joy_ids still point at the same pads
+    assert InputManager.INPUT_DEVICES == [None, b]
+    assert InputManager.get_device_index(3) == 1
+    assert mapping.joy_device is b
+    assert ButtonMappingButton(0, "pad b", 1).get_args()[3] == 1
+
+    with pytest.raises(AssertionError):
+        ButtonMappingButton(0, "pad a", 0)
@@ -0,0 +1,97 @@
+import random
+
+import pytest
+
+from controller import ControllerRegistry, make_controller
+from input_recorder import InputRecorder, InputReplay
+from resources import load_resource
+
+CONTROLLER = "default_controller_key.cfg"
+DIRECTIONS = [(x, y) for x in (-1, 0, 1) for y in (-1, 0, 1)]
+
+
+def get_controllers():
+    ControllerRegistry.clear()
+    keys = ControllerRegistry.get_controller(CONTROLLER)
+    devices = load_resource(CONTROLLER)["devices"]
+    other = make_controller("other_controller.cfg", devices)
+
+    return keys, other
+
+
+# held values that change now and then, like a player's input
+def get_script(controller, frames, seed):
+    r = random.Random(seed)
+    values = [d.default for d in controller.devices]
+    script = []
+
+    for f in range(frames):
+        if r.random() < .1:
+            values = [
+                r.choice(DIRECTIONS) if type(d.default) is tuple
+                else r.randint(0, 1)
+                for d in controller.devices]
+
+        script.append(list(values))
+
+    return script
+
+
+def record(path, scripts):
+    recorder = InputRecorder(str(path))
+
+    for frame in zip(*[script for c, script in scripts]):
+        for (controller, script), values in zip(scripts, frame):
+            recorder.record(controller, values)
+
+    recorder.close()
+
+
+def test_round_trip(tmp_path):
+    path = tmp_path / "run.zsir"
+    keys, other = get_controllers()
+    scripts = [
+        (keys, get_script(keys, 500, 1)),
+        (other, get_script(other, 500, 2))
+    ]
+    record(path, scripts)
+
+    replay = InputReplay(str(path))
+    assert replay.get_frame_count() == 500
+
+    for f in range(500):
+        for controller, script in scripts:
+            assert replay.get_values(controller) == script[f]
+
+    assert not replay.finished
+    assert replay.get_values(keys) == [d.default for d in keys.devices]
+    assert replay.finished
+
+
+def test_held_input_is_run_length_encoded(tmp_path):
+    path = tmp_path / "idle.zsir"
+    keys = get_controllers()[0]
+    idle = [d.default for d in keys.devices]
+    record(path, [(keys, [idle] * 10000)])
+
+    # header, one controller record and a single run
+    assert path.stat().st_size < 60
+    assert InputReplay(str(path)).get_frame_count() == 10000
+
+
+def test_mismatched_devices(tmp_path):
+    path = tmp_path / "run.zsir"
+    keys = get_controllers()[0]
+    record(path, [(keys, get_script(keys, 10, 1))])
+    keys.devices = keys.devices[:-1]
+
+    with pytest.raises(IOError):
+        InputReplay(str(path)).get_values(keys)
+
+
+def test_not_a_recording(tmp_path):
+    path = tmp_path / "bad.zsir"
+    path.write_bytes(b"nope!")
+
+    with pytest.raises(IOError):
+        InputReplay(str(path))
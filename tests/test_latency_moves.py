@@ -0,0 +1,63 @@
+import pytest
+
+from latency import LatencyMonitor
+from physics import PhysicsWorld
+
+
+class MoveRecorder:
+    def __init__(self):
+        self.moves = []
+
+    def on_move(self, entity):
+        self.moves.append(entity.name)
+
+
+@pytest.fixture
+def recorder(monkeypatch):
+    recorder = MoveRecorder()
+    monkeypatch.setattr(LatencyMonitor, "ACTIVE", recorder)
+
+    return recorder
+
+
+def test_only_input_forces_count_as_responses(make_sprite, recorder):
+    sprite = make_sprite("body", (100, 100))
+    physics = sprite.physics_interface
+
+    physics.apply_force(2, 0)
+    sprite.update()
+    assert recorder.moves == []
+
+    physics.apply_force(2, 0, from_input=True)
+    for f in range(5):
+        sprite.update()
+
+    # the frames after it are momentum
+    assert recorder.moves == ["body"]
+
+
+def test_letting_go_counts_as_a_response(make_sprite, recorder):
+    sprite = make_sprite("body", (100, 100))
+    physics = sprite.physics_interface
+
+    physics.apply_force(2, 0)
+    sprite.update()
+    physics.apply_force(0, 0, from_input=True)
+    sprite.update()
+
+    assert recorder.moves == ["body"]
+
+
+def test_world_bodies_report_input_moves(make_sprite, recorder):
+    sprite = make_sprite("body", (100, 100))
+    world = PhysicsWorld("test world")
+    world.add_body(sprite)
+
+    sprite.apply_force(2, 0)
+    world.step()
+    sprite.apply_force(2, 0, from_input=True)
+    world.step(.5, last=False)
+    world.step(.5, first=False)
+    world.step()
+
+    assert recorder.moves == ["body"]
@@ -0,0 +1,136 @@
+from classes import Group
+from collisions import CollisionLayer, CollisionManager
+from entities import Region
+from physics import PhysicsWorld, SLEEP_FRAMES
+
+FLOOR_Y = 200
+
+
+def put_to_sleep(sprite):
+    for f in range(SLEEP_FRAMES + 1):
+        sprite.update()
+
+    assert sprite.is_asleep()
+
+
+def test_body_sleeps_and_wakes_on_force(make_sprite):
+    sprite = make_sprite("body", (100, 100))
+    put_to_sleep(sprite)
+
+    sprite.apply_force(1, 0)
+    assert not sprite.is_asleep()
+
+    x = sprite.position[0]
+    sprite.update()
+    assert sprite.position[0] > x
+
+
+def test_zero_forces_are_dropped(make_sprite):
+    sprite = make_sprite("body", (100, 100))
+    physics = sprite.physics_interface
+    put_to_sleep(sprite)
+
+    for f in range(100):
+        sprite.apply_force(0, 0)
+        sprite.update()
+
+    assert physics.forces == []
+    assert sprite.is_asleep()
+
+
+def make_floor():
+    region = Region("test region")
+    region.set_walls(
+        {"name": "floor", "origin": (0, FLOOR_Y), "end": (1000, FLOOR_Y)})
+
+    return region
+
+
+# moves the sprite so the bottom of its collision rect is at y
+def place_bottom(sprite, y):
+    sprite.physics_interface.last_position = sprite.position
+    x, sy = sprite.position
+    sprite.set_position(x, sy + y - sprite.get_collision_rect().bottom)
+    sprite.physics_interface.last_position = sprite.position
+
+
+def test_wall_test_skipped_without_movement(make_sprite):
+    region = make_floor()
+
+    # the sprite's collision skeleton crosses the floor, which the discrete
+    # wall test used to snap out of when it was tested with no velocity
+    sprite = make_sprite("body", (100, 100))
+    place_bottom(sprite, FLOOR_Y + 3)
+    put_to_sleep(sprite)
+
+    position = sprite.position
+    sprite.wake()
+    sprite.update()
+
+    assert region.test_sprite_collision(sprite) == []
+    assert CollisionManager.sprite_region_collision_system(
+        [sprite], [region]) == 0
+    assert sprite.position == position
+
+
+def test_force_that_wakes_body_is_tested(make_sprite):
+    region = make_floor()
+    sprite = make_sprite("body", (100, 100))
+    place_bottom(sprite, FLOOR_Y - 1)
+    put_to_sleep(sprite)
+
+    sprite.apply_force(0, 6)
+    sprite.update()
+    assert not sprite.is_still()
+
+    tested = CollisionManager.sprite_region_collision_system(
+        [sprite], [region])
+    v = sprite.get_velocity().get_value()[1]
+
+    assert tested == 1
+    assert sprite.get_collision_rect().bottom + v <= FLOOR_Y + 1e-6
+
+
+def test_world_body_woken_by_force_isnt_still(make_sprite):
+    sprite = make_sprite("body", (100, 100))
+    world = PhysicsWorld("test world")
+    body = world.add_body(sprite)
+
+    body.asleep = True
+    sprite.apply_force(2, 0)
+    world.step()
+    assert sprite.position != sprite.get_last_position()
+    assert not sprite.is_still()
+
+
+# body sizes are measured when bodies are added, so picking substeps
+# doesn't make collision rects
+def test_adaptive_steps_use_cached_sizes(make_sprite, monkeypatch):
+    group = Group("test group")
+    sprites = make_sprite("a", (100, 100)), make_sprite("b", (300, 100))
+    for sprite in sprites:
+        sprite.set_group(group)
+
+    layer = CollisionLayer("test layer")
+    layer.set_physics_world(group)
+    layer.set_physics_steps("adaptive", 8)
+    world = layer.physics_world
+    world.set_bodies(layer.get_physics_items())
+
+    size = min(sprites[0].get_collision_rect().size)
+    assert world.get_min_size() == size
+
+    calls = []
+    for sprite in sprites:
+        monkeypatch.setattr(
+            sprite, "get_collision_rect", lambda: calls.append(1))
+
+    world.velocity[0] = size * 2.5, 0
+    assert layer.get_adaptive_steps() == 3
+
+    world.velocity[0] = size * 20, 0
+    assert layer.get_adaptive_steps() == 8
+    assert calls == []
+
+    world.asleep[:2] = True
+    assert world.get_min_size() == 0
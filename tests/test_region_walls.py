@@ -0,0 +1,115 @@
+from entities import Region
+from geometry import Rect, Vector, Wall
+
+FLOOR_Y = 200
+FLOOR = {"name": "floor", "origin": (0, FLOOR_Y), "end": (1000, FLOOR_Y)}
+
+
+def make_region(continuous=True):
+    region = Region("test region")
+    region.set_walls(dict(FLOOR))
+    region.set_continuous_collision(continuous)
+
+    return region
+
+
+# moves the sprite so the bottom of its collision rect is at y
+def place_bottom(sprite, y):
+    physics = sprite.physics_interface
+    physics.last_position = sprite.position
+
+    x, sy = sprite.position
+    sprite.set_position(x, sy + y - sprite.get_collision_rect().bottom)
+    physics.last_position = sprite.position
+
+
+def run(sprite, region, force, frames):
+    bottoms = []
+
+    for f in range(frames):
+        sprite.apply_force(*force)
+        sprite.update()
+
+        if region:
+            region.handle_sprite_collision(
+                sprite, region.test_sprite_collision(sprite))
+
+        bottoms.append(sprite.get_collision_rect().bottom)
+
+    return bottoms
+
+
+def test_penetration_normal_ignores_velocity():
+    wall = Wall("floor", (0, FLOOR_Y), (1000, FLOOR_Y))
+    rect = Rect((20, 20), (100, FLOOR_Y - 18))
+
+    normals = set()
+    for v in ((3, 1), (-3, -1), (0, -2), (0, 2)):
+        toi, normal, depth = wall.get_penetration(
+            rect, Vector("v", *v))
+        normals.add(tuple(round(n, 6) for n in normal.get_value()))
+
+    assert normals == {(0, -1)}
+
+
+def test_penetration_depth_pushes_moved_rect_out():
+    wall = Wall("floor", (0, FLOOR_Y), (1000, FLOOR_Y))
+    rect = Rect((20, 20), (100, FLOOR_Y - 18))
+
+    assert wall.get_penetration(rect, Vector("v", 0, 3))[2] == 5
+    assert wall.get_penetration(rect, Vector("v", 0, -3))[2] == 0
+    assert not wall.get_penetration(
+        Rect((20, 20), (100, FLOOR_Y - 25)), Vector("v", 0, 3))
+
+
+def test_swept_collision_skips_overlapping_rect():
+    wall = Wall("floor", (0, FLOOR_Y), (1000, FLOOR_Y))
+
+    assert not wall.get_swept_collision(
+        Rect((20, 20), (100, FLOOR_Y - 18)), Vector("v", 0, 3))
+
+    toi, normal, depth = wall.get_swept_collision(
+        Rect((20, 20), (100, FLOOR_Y - 30)), Vector("v", 0, 20))
+    assert toi == .5
+    assert normal.get_value() == (0, -1)
+
+
+# the sprite starts a little way into the wall, like the demo sprite does
+# with the walls in the corner it's placed in
+def test_sprite_slides_along_wall(make_sprite):
+    sprite = make_sprite("slider", (100, 100))
+    place_bottom(sprite, FLOOR_Y + 3)
+    x = sprite.position[0]
+
+    bottoms = run(sprite, make_region(), (1, 1), 60)
+
+    # each frame's collision rect is where the sprite was before it moved,
+    # so the first one is still in the wall
+    assert sprite.position[0] - x > 100
+    assert max(bottoms[1:]) <= FLOOR_Y + 1e-6
+
+
+def test_sprite_moves_away_from_touching_wall(make_sprite):
+    free = make_sprite("free", (100, 100))
+    place_bottom(free, FLOOR_Y)
+    run(free, None, (.5, -1), 30)
+
+    sprite = make_sprite("touching", (100, 100))
+    place_bottom(sprite, FLOOR_Y)
+    start = sprite.position[1]
+    run(sprite, make_region(), (.5, -1), 30)
+
+    fx, fy = free.position
+    x, y = sprite.position
+
+    assert abs(x - fx) < 1e-9 and abs(y - fy) < 1e-9
+    assert y < start - 30
+
+
+def test_fast_sprite_does_not_pass_through_wall(make_sprite):
+    sprite = make_sprite("fast", (100, 100))
+    place_bottom(sprite, FLOOR_Y - 10)
+
+    bottoms = run(sprite, make_region(), (0, 80), 5)
+
+    assert max(bottoms) <= FLOOR_Y + 1e-6
@@ -11,6 +11,8 @@ UNSELECTED_COLOR = 255, 255, 255
 CONTROLLER_FRAME_DEPTH = 300
 INIT_DELAY = 30
 HELD_DELAY = 15
+CHARGE_TIME = 30
+INPUT_EVENTS = False        # keep input state from pygame events instead of polling each frame
 UDLR = "up", "down", "left", "right"
 UDLR_VALUE = (0, -1), (0, 1), (-1, 0), (1, 0)
 